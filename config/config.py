@@ -54,8 +54,41 @@ PREPROCESSED_PATH = os.getenv(
     r"C:\Projects_Local\slitlamp_labeling_app\data\preprocessed_dataset.parquet"
 )
 
+# Closest-date annotations per exam, written by the preprocessing script
+PREPROCESSED_ANNOTATIONS_PATH = (
+    os.getenv("PREPROCESSED_ANNOTATIONS_PATH")
+    or (str(Path(PREPROCESSED_PATH).with_name("preprocessed_annotations.parquet")) if PREPROCESSED_PATH else "")
+)
+
+# Notes referenced by the precomputed closest-note pointers (note dates)
+PREPROCESSED_NOTES_PATH = (
+    os.getenv("PREPROCESSED_NOTES_PATH")
+    or (str(Path(PREPROCESSED_PATH).with_name("preprocessed_notes.parquet")) if PREPROCESSED_PATH else "")
+)
+
+# Compressed Progress Note texts (blob + note_texts.index.parquet), written by the preprocessing script
+NOTE_STORE_PATH = (
+    os.getenv("NOTE_STORE_PATH")
+    or (str(Path(PREPROCESSED_PATH).with_name("note_texts.bin")) if PREPROCESSED_PATH else "")
+)
+
+# Per-patient CSR index of the Progress Notes (sorted by pat_mrn, note_date), written by the preprocessing script
+NOTES_INDEX_PATH = (
+    os.getenv("NOTES_INDEX_PATH")
+    or (str(Path(PREPROCESSED_PATH).with_name("notes_index.npz")) if PREPROCESSED_PATH else "")
+)
+
+# Per-visit annotations index (sorted by maskedid, annotation_date), written by the preprocessing script
+ANNOTATIONS_INDEX_PATH = (
+    os.getenv("ANNOTATIONS_INDEX_PATH")
+    or (str(Path(PREPROCESSED_PATH).with_name("annotations_index.parquet")) if PREPROCESSED_PATH else "")
+)
+
 USE_PREPROCESSED = os.getenv("USE_PREPROCESSED", "True").lower() == "true"
 
+# Parquet schema metadata key holding the preprocessing parameters (JSON)
+PREPROCESSED_METADATA_KEY = b"slitlamp_preprocessing"
+
 # ======================================================
 # Application paths (project-relative, NOT in .env)
 # ======================================================
@@ -223,6 +256,47 @@ MAX_ANNOTATION_DAYS_DIFFERENCE = int(os.getenv("MAX_ANNOTATION_DAYS_DIFFERENCE",
 IMAGES_PER_SESSION = int(os.getenv("IMAGES_PER_SESSION", 50))
 AUTO_SAVE_INTERVAL = int(os.getenv("AUTO_SAVE_INTERVAL", 5))
 
+# Exams whose closest notes/annotations are kept in memory (per loaded dataset, shared by all sessions)
+EXAM_MEMO_SIZE = int(os.getenv("EXAM_MEMO_SIZE", 4096))
+
+# Route positions loaded ahead/behind the current image in the background, and threads doing it (all sessions)
+PREFETCH_DEPTH = int(os.getenv("PREFETCH_DEPTH", 3))
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", 4))
+
+# Images are sent to the browser downscaled to this width (JPEG or WEBP), cached for all sessions up to IMAGE_CACHE_MB
+DISPLAY_IMAGE_WIDTH = int(os.getenv("DISPLAY_IMAGE_WIDTH", 1280))
+DISPLAY_IMAGE_FORMAT = os.getenv("DISPLAY_IMAGE_FORMAT", "JPEG").upper()
+DISPLAY_IMAGE_QUALITY = int(os.getenv("DISPLAY_IMAGE_QUALITY", 85))
+IMAGE_CACHE_MB = int(os.getenv("IMAGE_CACHE_MB", 256))
+# Cached images are served without touching the share; an original is re-checked (size/mtime)
+# at most once per IMAGE_STAT_TTL seconds, so a replaced file shows up within that time
+IMAGE_STAT_TTL = float(os.getenv("IMAGE_STAT_TTL", 30))
+
+# Thumbnails for grid/review views, and previews prebuilt by preprocessing/create_image_previews.py
+THUMBNAIL_WIDTH = int(os.getenv("THUMBNAIL_WIDTH", 256))
+PREVIEW_CACHE_DIR = os.getenv("PREVIEW_CACHE_DIR") or str(Path(__file__).parent.parent / "data" / "previews")
+
+# Zoom viewer: tile pyramids cut on first zoom (least recently used removed past TILE_CACHE_GB),
+# and the zoom factors offered (1 = whole image)
+TILE_CACHE_DIR = os.getenv("TILE_CACHE_DIR") or str(Path(__file__).parent.parent / "data" / "tiles")
+TILE_CACHE_GB = float(os.getenv("TILE_CACHE_GB", 5))
+ZOOM_LEVELS = [int(z) for z in os.getenv("ZOOM_LEVELS", "1,2,4,8").split(",")]
+
+# Label saves are appended to a journal; after this many entries it is folded into the labels file
+LABEL_JOURNAL_COMPACT_EVERY = int(os.getenv("LABEL_JOURNAL_COMPACT_EVERY", 500))
+
+# Label storage: "json" (per-user files + journal) or "sqlite" (one WAL database for all users;
+# the JSON files are imported the first time it is opened)
+LABEL_STORE_BACKEND = os.getenv("LABEL_STORE_BACKEND", "json").lower()
+LABELS_DB_PATH = os.getenv("LABELS_DB_PATH") or str(LABELS_DIR / "labels.db")
+
+# Local copies of images read from IMAGE_BASE_PATH (0 disables the disk cache);
+# the next DISK_CACHE_WARM_DEPTH route positions are copied in the background
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR") or str(Path(__file__).parent.parent / "data" / "image_cache")
+IMAGE_DISK_CACHE_GB = float(os.getenv("IMAGE_DISK_CACHE_GB", 20))
+DISK_CACHE_WARM_DEPTH = int(os.getenv("DISK_CACHE_WARM_DEPTH", 20))
+DISK_CACHE_WARM_WORKERS = int(os.getenv("DISK_CACHE_WARM_WORKERS", 2))
+
 ENABLE_AUTOFILL_SAME_STUDYID = (
     os.getenv("ENABLE_AUTOFILL_SAME_STUDYID", "True").lower() == "true"
 )
@@ -133,11 +133,6 @@ def show_statistics():
     st.markdown("---")
     st.markdown("### 🔬 Detailed Condition Statistics")
     
-    # Get detailed stats from one user (they should all have same structure)
-    sample_username = list(all_stats.keys())[0]
-    label_manager = LabelManager(sample_username)
-    detailed_stats = label_manager.get_detailed_statistics()
-    
     # Create tabs for each condition
     condition_tabs = st.tabs([
         "👁️ Dry Eye",
@@ -153,8 +148,7 @@ def show_statistics():
         dry_eye_signs = {}
         
         for username, data in all_stats.items():
-            lm = LabelManager(username)
-            det_stats = lm.get_detailed_statistics()
+            det_stats = data['statistics']
             
             for sev, count in det_stats['detailed']['dry_eye']['by_severity'].items():
                 dry_eye_severity[sev] = dry_eye_severity.get(sev, 0) + count
@@ -188,8 +182,7 @@ def show_statistics():
         cataract_features = {}
         
         for username, data in all_stats.items():
-            lm = LabelManager(username)
-            det_stats = lm.get_detailed_statistics()
+            det_stats = data['statistics']
             
             for cat_type, count in det_stats['detailed']['cataract']['by_type'].items():
                 cataract_type[cat_type] = cataract_type.get(cat_type, 0) + count
@@ -229,8 +222,7 @@ def show_statistics():
         infectious_etiology = {}
         
         for username, data in all_stats.items():
-            lm = LabelManager(username)
-            det_stats = lm.get_detailed_statistics()
+            det_stats = data['statistics']
             
             for inf_type, count in det_stats['detailed']['infectious']['by_type'].items():
                 infectious_type[inf_type] = infectious_type.get(inf_type, 0) + count
@@ -263,8 +255,7 @@ def show_statistics():
         tumor_location = {}
         
         for username, data in all_stats.items():
-            lm = LabelManager(username)
-            det_stats = lm.get_detailed_statistics()
+            det_stats = data['statistics']
             
             for ttype, count in det_stats['detailed']['tumor']['by_type'].items():
                 tumor_type[ttype] = tumor_type.get(ttype, 0) + count
@@ -306,8 +297,7 @@ def show_statistics():
         sch_extent = {}
         
         for username, data in all_stats.items():
-            lm = LabelManager(username)
-            det_stats = lm.get_detailed_statistics()
+            det_stats = data['statistics']
             
             for pres, count in det_stats['detailed']['sch']['by_presence'].items():
                 sch_presence[pres] = sch_presence.get(pres, 0) + count
@@ -459,6 +449,9 @@ def show_label_review():
                             st.write(f"**Laterality:** {label['laterality']}")
                             st.write(f"**Quality:** {label['quality']}")
                             st.write(f"**Labeled at:** {label['labeled_at']}")
+                            history = label_manager.get_edit_history(int(idx_str))
+                            if history:
+                                st.write(f"**Edits:** {len(history)} (previous from {history[-1].get('labeled_at', 'N/A')})")
                         
                         with col2:
                             st.write(f"**Study ID:** {label.get('metadata', {}).get('maskedid_studyid', 'N/A')}")
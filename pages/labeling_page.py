@@ -3,10 +3,11 @@ Labeling page - main interface for image labeling with MULTILABEL support
 """
 
 import streamlit as st
-from PIL import Image
 from pathlib import Path
-from utils.data_loader import DataLoader
+from utils.data_loader import get_shared_data_loader, data_source_fingerprint
 from utils.label_manager import LabelManager
+from utils.prefetcher import RoutePrefetcher
+from utils.image_service import get_zoom_view
 from utils.auth import get_user_route_strategy
 from config.config import (
     LATERALITY_OPTIONS,
@@ -36,7 +37,8 @@ from config.config import (
     AUTO_SAVE_INTERVAL,
     DATASET_FILTER_OPTIONS,
     DEFAULT_DATASET_FILTER,
-    ENABLE_AUTOFILL_SAME_STUDYID
+    ENABLE_AUTOFILL_SAME_STUDYID,
+    ZOOM_LEVELS
 )
 
 def show():
@@ -46,17 +48,18 @@ def show():
     
     # Initialize data loader and label manager
     if 'data_loader' not in st.session_state:
-        st.session_state.data_loader = DataLoader()
         # Set filter mode from session state or use default
         filter_mode = st.session_state.get('dataset_filter', DEFAULT_DATASET_FILTER)
-        st.session_state.data_loader.filter_mode = filter_mode
         
         with st.spinner("Loading datasets..."):
-            # merge_datasets will handle loading (either preprocessed or regular)
-            success, message = st.session_state.data_loader.merge_datasets()
-            if not success:
-                st.error(message)
+            # One loaded dataset per filter mode is shared by all sessions
+            # (merge_datasets handles preprocessed or regular loading)
+            try:
+                data_loader, message = get_shared_data_loader(filter_mode, data_source_fingerprint())
+            except RuntimeError as e:
+                st.error(str(e))
                 return
+            st.session_state.data_loader = data_loader
             st.success(message)
     
     if 'label_manager' not in st.session_state:
@@ -85,7 +88,7 @@ def show():
     
     # Progress bar
     total_images = len(st.session_state.route_indices)
-    labeled_count = st.session_state.label_manager.get_labeled_count()
+    labeled_count = st.session_state.label_manager.get_labeled_count(st.session_state.route_indices)
     progress = labeled_count / total_images if total_images > 0 else 0
     
     st.progress(progress)
@@ -137,9 +140,16 @@ def show():
     
     st.markdown("---")
     
-    # Get current image data
+    # Background loading follows this session's route (reset when the dataset changes)
+    prefetcher = st.session_state.get('prefetcher')
+    if prefetcher is None or prefetcher.data_loader is not st.session_state.data_loader:
+        prefetcher = st.session_state.prefetcher = RoutePrefetcher(st.session_state.data_loader)
+    
+    # Get current image data (usually already prefetched), then warm the neighbours
     current_index = st.session_state.route_indices[st.session_state.current_position]
-    image_data, message = st.session_state.data_loader.get_image_data(current_index)
+    record = prefetcher.get(current_index)
+    prefetcher.prefetch(st.session_state.route_indices, st.session_state.current_position)
+    image_data, message = record['image_data'], record['message']
     
     if image_data is None:
         st.error(f"Error loading image data: {message}")
@@ -167,16 +177,18 @@ def show():
         st.markdown("### 📸 Image")
         
         image_path = Path(image_data['image_path'])
-        if image_path.exists():
-            try:
-                img = Image.open(image_path)
-                st.image(img, use_container_width=True)
+        if record['image_exists']:
+            if record['image'] is not None:
+                if st.toggle("🔍 Zoom", key=f"zoom_{current_index}"):
+                    show_zoom_viewer(image_path, current_index)
+                else:
+                    st.image(record['image'], use_container_width=True)
                 
                 # Image info
                 st.caption(f"**File:** {image_data['photo_name']}")
                 st.caption(f"**Index:** {current_index} | **Position:** {st.session_state.current_position + 1}/{total_images}")
-            except Exception as e:
-                st.error(f"Error loading image: {str(e)}")
+            else:
+                st.error(f"Error loading image: {record['image_error']}")
                 st.code(str(image_path))
         else:
             st.warning("⚠️ Image file not found")
@@ -770,7 +782,9 @@ def show():
                     st.caption(f"Date: {note['note_date'].strftime('%Y-%m-%d')}")
                     
                     note_text = note['note_text']
-                    if len(note_text) > 500:
+                    if note_text is None:
+                        st.caption("Note text not available - the note text store is missing or out of date")
+                    elif len(note_text) > 500:
                         with st.expander("View full note"):
                             st.text(note_text)
                     else:
@@ -797,3 +811,26 @@ def show():
             if st.session_state.current_position < total_images - 1:
                 st.session_state.current_position += 1
                 st.rerun()
+
+def show_zoom_viewer(image_path, current_index):
+    """Zoom/pan view of the full-resolution image (only the visible tiles are read)"""
+    col_zoom, col_x, col_y = st.columns(3)
+    with col_zoom:
+        zoom = st.select_slider(
+            "Zoom",
+            options=ZOOM_LEVELS,
+            value=ZOOM_LEVELS[min(1, len(ZOOM_LEVELS) - 1)],
+            format_func=lambda z: f"{z}x",
+            key=f"zoom_level_{current_index}"
+        )
+    with col_x:
+        center_x = st.slider("Horizontal", 0, 100, 50, format="%d%%", key=f"zoom_x_{current_index}")
+    with col_y:
+        center_y = st.slider("Vertical", 0, 100, 50, format="%d%%", key=f"zoom_y_{current_index}")
+    
+    try:
+        view, (x0, y0, x1, y1) = get_zoom_view(image_path, zoom, center_x / 100, center_y / 100)
+        st.image(view, use_container_width=True)
+        st.caption(f"Showing {x0:.0%}-{x1:.0%} horizontally, {y0:.0%}-{y1:.0%} vertically")
+    except Exception as e:
+        st.error(f"Error loading zoom view: {str(e)}")
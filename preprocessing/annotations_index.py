@@ -0,0 +1,113 @@
+"""
+Per-visit annotation index for DataLoader.get_annotations
+
+Preprocessing writes the annotations sorted by (maskedid, annotation_date,
+original order). On load the file becomes a two-level CSR structure:
+
+    maskedids[i]                               -> i-th maskedid (sorted)
+    visit_offsets[i]:visit_offsets[i + 1]      -> its visits (one per annotation_date, sorted)
+    visit_records[v]                           -> pre-built (examfield, value, laterality, position) tuples
+
+The closest visit inside the window is then found by bisection over the
+maskedid's visit dates, without any pandas work per request.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+NS_PER_DAY = 86_400 * 10**9
+
+# Column defaults follow DataLoader.get_annotations (annotation.get(column, default))
+RECORD_DEFAULTS = {'examfield': 'Unknown', 'value': 'N/A', 'laterality': 'Unknown'}
+
+
+def build_annotations_index(annotations_df):
+    """Annotations sorted by (maskedid, annotation_date, original order), ready to be written"""
+    index_df = pd.DataFrame({
+        'maskedid': annotations_df['maskedid'].astype(str).to_numpy(),
+        'annotation_date': annotations_df['annotation_date'].to_numpy(),
+        'position': np.arange(len(annotations_df))
+    })
+    for column, default in RECORD_DEFAULTS.items():
+        index_df[column] = annotations_df[column].to_numpy() if column in annotations_df.columns else default
+
+    index_df = index_df.dropna(subset=['annotation_date'])
+    return index_df.sort_values(['maskedid', 'annotation_date', 'position'], kind='stable').reset_index(drop=True)
+
+
+def write_annotations_index(index_df, output_path):
+    """Write the sorted annotations (replaced atomically)"""
+    tmp_path = f"{output_path}.tmp"
+    index_df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, output_path)
+
+
+class AnnotationsIndex:
+    """Read-only per-visit annotation index loaded from the parquet written by preprocessing"""
+
+    def __init__(self, path):
+        index_df = pd.read_parquet(path)
+        maskedids = index_df['maskedid'].to_numpy(dtype=str)
+        dates_ns = index_df['annotation_date'].to_numpy(dtype='datetime64[ns]').view('int64')
+
+        # One visit per (maskedid, annotation_date) run of the sorted rows
+        new_visit = np.r_[True, (maskedids[1:] != maskedids[:-1]) | (dates_ns[1:] != dates_ns[:-1])]
+        visit_starts = np.flatnonzero(new_visit)
+        visit_ends = np.r_[visit_starts[1:], len(index_df)]
+
+        self.maskedids, maskedid_starts = np.unique(maskedids[visit_starts], return_index=True)
+        self.visit_offsets = np.append(maskedid_starts, len(visit_starts)).astype('int64')
+        self.visit_ns = dates_ns[visit_starts]
+        self.visit_dates = [pd.Timestamp(ns) for ns in self.visit_ns]
+
+        # Missing values come back as NaN, like rows of the annotations CSV
+        columns = [
+            index_df[column].astype(object).where(index_df[column].notna(), np.nan).tolist()
+            for column in RECORD_DEFAULTS
+        ]
+        records = list(zip(*columns, index_df['position'].tolist()))
+        self.visit_records = [records[start:end] for start, end in zip(visit_starts, visit_ends)]
+        self.record_count = len(records)
+
+    def __len__(self):
+        return self.record_count
+
+    def closest_annotations(self, maskedid, exam_date, max_days):
+        """
+        Same rule as DataLoader.get_annotations: every annotation of the visit(s)
+        with the smallest day difference inside the window, in original order
+        Returns: list of dicts (same format as get_annotations)
+        """
+        i = np.searchsorted(self.maskedids, maskedid)
+        if i >= len(self.maskedids) or self.maskedids[i] != maskedid:
+            return []
+
+        # Visits in [exam - max_days, exam + max_days + 1) in ns, i.e. `.dt.days.abs() <= max_days`
+        exam_ns = pd.Timestamp(exam_date).value
+        start, end = self.visit_offsets[i], self.visit_offsets[i + 1]
+        visit_ns = self.visit_ns[start:end]
+        lo = start + np.searchsorted(visit_ns, exam_ns - max_days * NS_PER_DAY, side='left')
+        hi = start + np.searchsorted(visit_ns, exam_ns + (max_days + 1) * NS_PER_DAY, side='left')
+        if lo == hi:
+            return []
+
+        days = {v: int((self.visit_ns[v] - exam_ns) // NS_PER_DAY) for v in range(lo, hi)}
+        min_diff = min(abs(d) for d in days.values())
+        closest = [
+            (record, v)
+            for v in range(lo, hi) if abs(days[v]) == min_diff
+            for record in self.visit_records[v]
+        ]
+        closest.sort(key=lambda item: item[0][3])
+
+        return [
+            {
+                'examfield': examfield,
+                'value': value,
+                'annotation_date': self.visit_dates[v],
+                'days_diff': days[v],
+                'laterality': laterality
+            }
+            for (examfield, value, laterality, _), v in closest
+        ]
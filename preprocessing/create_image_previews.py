@@ -0,0 +1,148 @@
+"""
+Preview build stage: thumbnails and display-size previews for every image
+Run after create_preprocessed_dataset.py; safe to interrupt and run again
+"""
+
+import os
+import argparse
+from pathlib import Path
+from datetime import datetime
+import sys
+import time
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from config.config import (
+    PREPROCESSED_PATH,
+    IMAGE_BASE_PATH,
+    DISPLAY_IMAGE_WIDTH,
+    DISPLAY_IMAGE_FORMAT,
+    DISPLAY_IMAGE_QUALITY,
+    THUMBNAIL_WIDTH,
+    PREVIEW_CACHE_DIR
+)
+from preprocessing.dataset_io import read_dataset
+from preprocessing.image_previews import (
+    write_previews,
+    preview_file,
+    preview_settings,
+    read_manifest,
+    write_manifest
+)
+
+PATH_COLUMNS = ['maskedid', 'maskedid_studyid', 'proc_name', 'photo_name']
+
+# Manifest is saved every CHECKPOINT_EVERY processed images, so an interrupted run loses little
+CHECKPOINT_EVERY = 2000
+
+def load_image_paths(dataset_path):
+    """Unique image paths of the preprocessed dataset (same layout as DataLoader.get_image_path)"""
+    print(f"Loading image paths from {dataset_path}...")
+    df = read_dataset(dataset_path, columns=PATH_COLUMNS).astype(str)
+    paths = [
+        str(Path(IMAGE_BASE_PATH) / maskedid / studyid / proc_name / photo_name)
+        for maskedid, studyid, proc_name, photo_name in zip(*(df[column] for column in PATH_COLUMNS))
+    ]
+    paths = list(dict.fromkeys(paths))
+    print(f"  {len(paths):,} unique images")
+    return paths
+
+def is_up_to_date(entry, stat, preview_dir, widths):
+    """Manifest entry matches the original and all its previews exist"""
+    if entry is None or (entry['size'], entry['mtime_ns']) != (stat.st_size, stat.st_mtime_ns):
+        return False
+    return all(preview_file(preview_dir, entry['digest'], width, DISPLAY_IMAGE_FORMAT).exists() for width in widths)
+
+def build_preview(task):
+    """Worker: write the previews of one original; returns a manifest row or an error"""
+    image_path, size, mtime_ns, preview_dir, widths = task
+    try:
+        digest = write_previews(image_path, preview_dir, widths, DISPLAY_IMAGE_FORMAT, DISPLAY_IMAGE_QUALITY)
+        return {'image_path': image_path, 'size': size, 'mtime_ns': mtime_ns, 'digest': digest}, None
+    except Exception as e:
+        return None, f"{image_path}: {e}"
+
+def parse_args(argv=None):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Build thumbnails and display previews for the labeling app")
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of worker processes (default: all cores)"
+    )
+    parser.add_argument(
+        '--full',
+        action='store_true',
+        help="Ignore the manifest and process every image again"
+    )
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """Main preview build function"""
+    args = parse_args(argv)
+
+    print("="*60)
+    print("SLITLAMP IMAGE PREVIEWS")
+    print("="*60)
+
+    preview_dir = Path(PREVIEW_CACHE_DIR)
+    preview_dir.mkdir(parents=True, exist_ok=True)
+    widths = [THUMBNAIL_WIDTH, DISPLAY_IMAGE_WIDTH]
+    settings = preview_settings(widths, DISPLAY_IMAGE_FORMAT, DISPLAY_IMAGE_QUALITY)
+
+    manifest_df, previous_settings = read_manifest(preview_dir)
+    if args.full or previous_settings != settings:
+        if len(manifest_df):
+            print("Preview settings changed (or --full) - processing every image")
+        manifest_df = manifest_df.iloc[0:0]
+    manifest = {row['image_path']: row for row in manifest_df.to_dict('records')}
+
+    image_paths = load_image_paths(PREPROCESSED_PATH)
+
+    # Skip originals whose manifest entry and previews are up to date
+    print("\nChecking which images need previews...")
+    tasks = []
+    missing = 0
+    for image_path in image_paths:
+        try:
+            stat = os.stat(image_path)
+        except OSError:
+            missing += 1
+            continue
+        if not is_up_to_date(manifest.get(image_path), stat, preview_dir, widths):
+            tasks.append((image_path, stat.st_size, stat.st_mtime_ns, str(preview_dir), widths))
+    print(f"  To process: {len(tasks):,} | up to date: {len(image_paths) - len(tasks) - missing:,} | missing originals: {missing:,}")
+
+    def checkpoint():
+        write_manifest(pd.DataFrame(list(manifest.values()), columns=['image_path', 'size', 'mtime_ns', 'digest']), preview_dir, settings)
+
+    errors = []
+    start_time = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for done, (row, error) in enumerate(pool.map(build_preview, tasks, chunksize=16), start=1):
+            if error is not None:
+                errors.append(error)
+            else:
+                manifest[row['image_path']] = row
+            if done % CHECKPOINT_EVERY == 0:
+                checkpoint()
+                elapsed = time.perf_counter() - start_time
+                print(f"  Processed {done:,} / {len(tasks):,} ({done / elapsed:.1f} images/s)")
+    checkpoint()
+
+    print("\n" + "="*60)
+    print("PREVIEWS COMPLETE!")
+    print("="*60)
+    print(f"  Processed: {len(tasks) - len(errors):,} in {time.perf_counter() - start_time:.1f}s with {args.workers} workers")
+    print(f"  Failed: {len(errors):,}")
+    for error in errors[:10]:
+        print(f"    {error}")
+    print(f"  Manifest: {preview_dir / 'manifest.parquet'} ({len(manifest):,} images)")
+    print(f"  Finished at {datetime.now().isoformat(timespec='seconds')}")
+
+if __name__ == "__main__":
+    main()
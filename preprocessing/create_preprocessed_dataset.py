@@ -5,9 +5,14 @@ Run this ONCE to create the preprocessed dataset, then use it in the main app
 
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import json
+import argparse
 from pathlib import Path
 from datetime import datetime
 import sys
+import time
 
 # Add parent directory to path
 sys.path.append(str(Path(__file__).parent.parent))
@@ -18,14 +23,49 @@ from config.config import (
     CROSS_PATH,
     ANNOTATIONS_PATH,
     MAX_NOTE_DAYS_DIFFERENCE,
-    MAX_ANNOTATION_DAYS_DIFFERENCE
+    MAX_ANNOTATION_DAYS_DIFFERENCE,
+    PREPROCESSED_METADATA_KEY
 )
+from preprocessing.matching import (
+    resolve_notes,
+    resolve_annotations,
+    distance_profile,
+    floor_days,
+    to_ns
+)
+from preprocessing.parallel import run_serial, run_sharded
+from preprocessing.notes_reader import (
+    NOTE_INDEX_COLUMNS,
+    read_notes,
+    count_notes,
+    normalize_note_ids
+)
+from preprocessing.note_store import write_note_store, note_store_index_path
+from preprocessing.notes_index import build_notes_index, write_notes_index
+from preprocessing.annotations_index import build_annotations_index, write_annotations_index
+from preprocessing.dataset_io import write_partitioned_dataset, read_dataset, read_build_info
 
-def load_all_data():
-    """Load all datasets"""
-    print("Loading datasets...")
-    
-    # Load diagnosis data
+# Inputs fingerprinted for incremental runs
+SOURCE_PATHS = {
+    'diagnosis': DIAGNOSIS_PATH,
+    'notes': ANONYMIZED_EHR_PATH,
+    'crosswalk': CROSS_PATH,
+    'annotations': ANNOTATIONS_PATH
+}
+
+# Bump when the output columns (or the rules filling them) change, so the next run does a full rebuild
+PREPROCESSING_VERSION = 7
+
+# Standard windows (days) stored as notes_count_<N>d / annotations_count_<N>d,
+# next to the window-independent note_nearest_days / annotation_nearest_days
+NOTE_COUNT_WINDOWS = (30, 90, 180, 365)
+ANNOTATION_COUNT_WINDOWS = (1, 7, 14, 30)
+
+# Repetitive string columns stored dictionary-encoded (loaded as pandas categoricals)
+DICTIONARY_COLUMNS = ['pat_mrn', 'maskedid', 'maskedid_studyid', 'proc_name', 'photo_name', 'laterality']
+
+def load_diagnosis_data():
+    """Load diagnosis data"""
     print("  - Loading diagnosis data...")
     diagnosis_df = pd.read_stata(DIAGNOSIS_PATH)
     diagnosis_df['exam_date'] = pd.to_datetime(diagnosis_df['exam_date'])
@@ -33,29 +73,35 @@ def load_all_data():
     # Convert pat_mrn to string for consistent matching
     if 'pat_mrn' in diagnosis_df.columns:
         diagnosis_df['pat_mrn'] = diagnosis_df['pat_mrn'].astype(str).str.strip()
-    
-    # Load notes data
+    return diagnosis_df
+
+def load_notes_data():
+    """Load notes data (Progress Notes only; note_text is reduced to note_text_hash)"""
     print("  - Loading notes data...")
-    notes_df = pd.read_parquet(ANONYMIZED_EHR_PATH)
-    notes_df['note_date'] = pd.to_datetime(notes_df['note_date'])
-    
-    # Convert pat_mrn to string for consistent matching
-    if 'pat_mrn' in notes_df.columns:
-        notes_df['pat_mrn'] = notes_df['pat_mrn'].astype(str).str.strip()
-    
-    # Filter for Progress Notes only
-    if 'ip_note_type' in notes_df.columns:
-        original_count = len(notes_df)
-        notes_df = notes_df[notes_df['ip_note_type'] == 'Progress Notes'].copy()
-        print(f"     Filtered to Progress Notes: {len(notes_df):,} / {original_count:,} ({100*len(notes_df)/original_count:.1f}%)")
+    # Streamed in record batches with the note type filter pushed into the scan;
+    # note_text goes straight to the note text store (see save_note_store); only its hash is
+    # kept here, so the per-patient digests also change when a note is edited
+    notes_df = read_notes(ANONYMIZED_EHR_PATH, NOTE_INDEX_COLUMNS, text_hash=True)
+    
+    if 'ip_note_type' in pq.read_schema(ANONYMIZED_EHR_PATH).names:
+        progress_count, original_count = count_notes(ANONYMIZED_EHR_PATH)
+        print(f"     Filtered to Progress Notes: {progress_count:,} / {original_count:,} ({100*progress_count/max(original_count, 1):.1f}%)")
     else:
         print("     Warning: 'ip_note_type' column not found - using all notes")
-    
-    # Load crosswalk data
+    return notes_df
+
+def load_crosswalk_data():
+    """Load crosswalk data"""
     print("  - Loading crosswalk data...")
     cross_df = pd.read_csv(CROSS_PATH)
     
-    # Load annotations data
+    # Convert maskedid to string for consistent matching
+    if 'maskedid' in cross_df.columns:
+        cross_df['maskedid'] = cross_df['maskedid'].astype(str).str.strip()
+    return cross_df
+
+def load_annotations_data():
+    """Load annotations data"""
     print("  - Loading annotations data...")
     annotations_df = pd.read_csv(ANNOTATIONS_PATH)
     if 'studyid' in annotations_df.columns:
@@ -66,9 +112,15 @@ def load_all_data():
     # Convert maskedid to string for consistent matching
     if 'maskedid' in annotations_df.columns:
         annotations_df['maskedid'] = annotations_df['maskedid'].astype(str).str.strip()
-    if 'maskedid' in cross_df.columns:
-        cross_df['maskedid'] = cross_df['maskedid'].astype(str).str.strip()
-    
+    return annotations_df
+
+def load_all_data():
+    """Load all datasets"""
+    print("Loading datasets...")
+    diagnosis_df = load_diagnosis_data()
+    notes_df = load_notes_data()
+    cross_df = load_crosswalk_data()
+    annotations_df = load_annotations_data()
     print("All datasets loaded successfully!")
     return diagnosis_df, notes_df, cross_df, annotations_df
 
@@ -93,12 +145,84 @@ def merge_base_data(cross_df, diagnosis_df):
                 merged_df[original_col] = merged_df[col]
             merged_df.drop(col, axis=1, inplace=True)
     
+    # Normalize join keys once so row hashes are stable across runs
+    for col in ('pat_mrn', 'maskedid'):
+        if col in merged_df.columns:
+            merged_df[col] = merged_df[col].astype(str).str.strip()
+    
+    # Fingerprint of each base row (detects new or changed crosswalk/diagnosis rows)
+    merged_df['row_hash'] = pd.util.hash_pandas_object(merged_df, index=False).to_numpy()
+    
     print(f"Merged dataset has {len(merged_df)} rows")
     return merged_df
 
-def add_notes_flags(merged_df, notes_df):
-    """Add flag indicating if patient has matching notes"""
+def scatter_positions(local_positions, event_positions):
+    """Map shard-local event positions back to positions in the full frame (-1 stays -1)"""
+    global_positions = np.full(len(local_positions), -1, dtype='int64')
+    found = local_positions >= 0
+    global_positions[found] = event_positions[local_positions[found]]
+    return global_positions
+
+def match_distance_profile(row_keys, row_dates, event_keys, event_dates, windows, workers=1, label="Distance profile"):
+    """
+    Nearest day distance and counts at the standard windows, sharded by key when workers > 1
+    Returns: (nearest_days, counts) - see matching.distance_profile
+    """
+    row_args = [row_keys, row_dates]
+    event_args = [event_keys, event_dates]
+    if workers <= 1:
+        return run_serial(distance_profile, (*row_args, *event_args, windows), label)
+    
+    nearest = np.full(len(row_keys), -1, dtype='int64')
+    counts = np.zeros((len(row_keys), len(windows)), dtype='int64')
+    for rows, _, (shard_nearest, shard_counts) in run_sharded(
+        distance_profile, row_keys, row_args, event_keys, event_args, (windows,), workers, label
+    ):
+        nearest[rows] = shard_nearest
+        counts[rows] = shard_counts
+    return nearest, counts
+
+def add_distance_columns(merged_df, nearest_column, count_prefix, nearest, counts, windows):
+    """Store the nearest day distance (NA without any event) and the counts at the standard windows"""
+    merged_df[nearest_column] = pd.Series(nearest, index=merged_df.index, dtype='Int64').where(nearest >= 0)
+    for window, window_counts in zip(windows, counts.T):
+        merged_df[f'{count_prefix}_count_{window}d'] = window_counts
+    return merged_df
+
+def match_notes(merged_df, notes_df, workers=1):
+    """
+    Run the notes interval join, sharded by pat_mrn over a process pool when workers > 1
+    Returns: (notes_count, first, second) - first/second are row positions in notes_df
+    """
+    row_args = [merged_df['pat_mrn'], merged_df['exam_date']]
+    note_args = [notes_df['pat_mrn'], notes_df['note_date']]
+    if workers <= 1:
+        return run_serial(resolve_notes, (*row_args, *note_args, MAX_NOTE_DAYS_DIFFERENCE), "Notes join")
+    
+    notes_count = np.zeros(len(merged_df), dtype='int64')
+    first = np.full(len(merged_df), -1, dtype='int64')
+    second = np.full(len(merged_df), -1, dtype='int64')
+    shards = run_sharded(
+        resolve_notes,
+        merged_df['pat_mrn'], row_args,
+        notes_df['pat_mrn'], note_args,
+        (MAX_NOTE_DAYS_DIFFERENCE,),
+        workers,
+        "Notes join"
+    )
+    for rows, events, (shard_count, shard_first, shard_second) in shards:
+        notes_count[rows] = shard_count
+        first[rows] = scatter_positions(shard_first, events)
+        second[rows] = scatter_positions(shard_second, events)
+    return notes_count, first, second
+
+def add_notes_flags(merged_df, notes_df, workers=1):
+    """
+    Add flag indicating if patient has matching notes
+    Returns: (merged_df, first, second) - closest-note positions for add_closest_note_pointers
+    """
     print("\nCalculating notes matches...")
+    start_time = time.time()
     
     # Ensure pat_mrn is string in merged_df too
     if 'pat_mrn' in merged_df.columns:
@@ -117,39 +241,106 @@ def add_notes_flags(merged_df, notes_df):
     mrns_in_both = set(merged_df['pat_mrn'].dropna()) & set(notes_df['pat_mrn'].dropna())
     print(f"  Debug: MRNs in both datasets: {len(mrns_in_both):,}")
     
-    # Group notes by patient
-    notes_by_patient = notes_df.groupby('pat_mrn')
-    
-    total = len(merged_df)
-    matches_found = 0
-    
-    for idx, row in merged_df.iterrows():
-        if idx % 10000 == 0:
-            print(f"  Processing row {idx:,}/{total:,} ({100*idx/total:.1f}%) - Matches so far: {matches_found:,}")
-        
-        pat_mrn = row.get('pat_mrn')
-        exam_date = row.get('exam_date')
-        
-        if pd.notna(pat_mrn) and pd.notna(exam_date) and pat_mrn in notes_by_patient.groups:
-            patient_notes = notes_by_patient.get_group(pat_mrn)
-            
-            # Calculate days difference
-            days_diff = (patient_notes['note_date'] - exam_date).dt.days.abs()
-            
-            # Check if any notes within threshold
-            matching_notes = (days_diff <= MAX_NOTE_DAYS_DIFFERENCE).sum()
-            
-            if matching_notes > 0:
-                merged_df.at[idx, 'has_notes'] = True
-                merged_df.at[idx, 'notes_count'] = matching_notes
-                matches_found += 1
+    # Vectorized interval join: notes sorted by (pat_mrn, note_date) once,
+    # then window bounds for every row via binary search (no per-row loop)
+    notes_count, first, second = match_notes(merged_df, notes_df, workers)
+    merged_df['has_notes'] = notes_count > 0
+    merged_df['notes_count'] = notes_count
+    
+    # Window-independent columns: the app re-derives has_notes for the configured window
+    nearest, counts = match_distance_profile(
+        merged_df['pat_mrn'], merged_df['exam_date'],
+        notes_df['pat_mrn'], notes_df['note_date'],
+        NOTE_COUNT_WINDOWS, workers, "Notes distance profile"
+    )
+    merged_df = add_distance_columns(merged_df, 'note_nearest_days', 'notes', nearest, counts, NOTE_COUNT_WINDOWS)
     
+    print(f"  Matched {len(merged_df):,} rows against {len(notes_df):,} notes in {time.time() - start_time:.1f}s")
     print(f"Found {merged_df['has_notes'].sum():,} images with matching notes ({100*merged_df['has_notes'].sum()/len(merged_df):.2f}%)")
-    return merged_df
+    return merged_df, first, second
+
+def add_closest_note_pointers(merged_df, notes_df, first, second):
+    """
+    Store the closest-note rule of DataLoader.get_closest_notes per image:
+    - exam between two notes -> closest note before and closest note after
+      (the first in original order of the closest day on each side)
+    - otherwise -> the closest note(s) (up to two, in original order)
+    Stores note_id_1/2, note_days_diff_1/2 and note_position_1/2 per row
+    """
+    print("\nStoring closest notes per image...")
+    
+    if notes_df.empty:
+        for suffix in ('1', '2'):
+            merged_df[f'note_id_{suffix}'] = pd.NA
+            merged_df[f'note_days_diff_{suffix}'] = pd.Series(pd.NA, index=merged_df.index, dtype='Int64')
+            merged_df[f'note_position_{suffix}'] = None
+        return merged_df, np.array([], dtype='int64')
+    
+    note_ids = normalize_note_ids(notes_df['note_id'])
+    note_ns = to_ns(notes_df['note_date'])
+    exam_ns = to_ns(merged_df['exam_date'])
+    
+    for suffix, positions in (('1', first), ('2', second)):
+        found = positions >= 0
+        safe = np.where(found, positions, 0)
+        days_diff = floor_days(note_ns[safe], exam_ns)
+        
+        merged_df[f'note_id_{suffix}'] = note_ids.iloc[safe].set_axis(merged_df.index).where(found)
+        merged_df[f'note_days_diff_{suffix}'] = pd.Series(days_diff, index=merged_df.index, dtype='Int64').where(found)
+        merged_df[f'note_position_{suffix}'] = np.where(
+            ~found, None,
+            np.where(days_diff < 0, 'before', np.where(days_diff > 0, 'after', 'same_day'))
+        )
+    
+    print(f"  Closest notes found for {(first >= 0).sum():,} images")
+    return merged_df, np.unique(np.concatenate([first[first >= 0], second[second >= 0]]))
+
+def build_note_context(notes_df, note_positions):
+    """Side table with the date of every note referenced by the closest-note pointers (texts live in the note store)"""
+    context_df = notes_df.iloc[note_positions][['note_id', 'note_date']]
+    context_df = context_df.drop_duplicates('note_id').reset_index(drop=True)
+    print(f"  {len(context_df):,} notes referenced by the closest-note pointers")
+    return context_df
+
+def match_annotations(merged_df, annotations_df, workers=1):
+    """
+    Run the annotations interval join, sharded by maskedid over a process pool when workers > 1
+    Returns: (annotations_count, (record_contexts, record_positions, record_days_diff))
+    """
+    row_args = [merged_df['maskedid'], merged_df['exam_date'], merged_df['annotation_ctx']]
+    annotation_args = [annotations_df['maskedid'], annotations_df['annotation_date']]
+    if workers <= 1:
+        annotations_count, *records = run_serial(
+            resolve_annotations, (*row_args, *annotation_args, MAX_ANNOTATION_DAYS_DIFFERENCE), "Annotations join"
+        )
+        return annotations_count, tuple(records)
+    
+    annotations_count = np.zeros(len(merged_df), dtype='int64')
+    record_parts = []
+    shards = run_sharded(
+        resolve_annotations,
+        merged_df['maskedid'], row_args,
+        annotations_df['maskedid'], annotation_args,
+        (MAX_ANNOTATION_DAYS_DIFFERENCE,),
+        workers,
+        "Annotations join"
+    )
+    for rows, events, (shard_count, contexts, positions, days_diff) in shards:
+        annotations_count[rows] = shard_count
+        record_parts.append((contexts, events[positions], days_diff))
+    
+    # Same (context, original position) order as the single-process run
+    contexts, positions, days_diff = (np.concatenate(part) for part in zip(*record_parts))
+    order = np.lexsort((positions, contexts))
+    return annotations_count, (contexts[order], positions[order], days_diff[order])
 
-def add_annotations_flags(merged_df, annotations_df):
-    """Add flag indicating if image has matching annotations"""
+def add_annotations_flags(merged_df, annotations_df, workers=1):
+    """
+    Add flag indicating if image has matching annotations
+    Returns: (merged_df, records) - closest annotation records for build_annotation_context
+    """
     print("\nCalculating annotations matches...")
+    start_time = time.time()
     
     # Ensure maskedid is string in merged_df too
     if 'maskedid' in merged_df.columns:
@@ -158,6 +349,9 @@ def add_annotations_flags(merged_df, annotations_df):
     merged_df['has_annotations'] = False
     merged_df['annotations_count'] = 0
     
+    # Key of the exam context used to look up the precomputed annotations
+    merged_df['annotation_ctx'] = annotation_context_keys(merged_df)
+    
     # Debug: Check unique values
     unique_ids_merged = merged_df['maskedid'].dropna().nunique()
     unique_ids_annotations = annotations_df['maskedid'].dropna().nunique()
@@ -168,42 +362,71 @@ def add_annotations_flags(merged_df, annotations_df):
     ids_in_both = set(merged_df['maskedid'].dropna()) & set(annotations_df['maskedid'].dropna())
     print(f"  Debug: maskedids in both datasets: {len(ids_in_both):,}")
     
-    # Group annotations by maskedid
-    annotations_by_id = annotations_df.groupby('maskedid')
-    
-    total = len(merged_df)
-    matches_found = 0
+    # Vectorized interval join (same engine as notes)
+    annotations_count, records = match_annotations(merged_df, annotations_df, workers)
+    merged_df['has_annotations'] = annotations_count > 0
+    merged_df['annotations_count'] = annotations_count
     
-    for idx, row in merged_df.iterrows():
-        if idx % 10000 == 0:
-            print(f"  Processing row {idx:,}/{total:,} ({100*idx/total:.1f}%) - Matches so far: {matches_found:,}")
-        
-        maskedid = row.get('maskedid')
-        exam_date = row.get('exam_date')
-        
-        if pd.notna(maskedid) and pd.notna(exam_date) and maskedid in annotations_by_id.groups:
-            patient_anns = annotations_by_id.get_group(maskedid)
-            
-            # Calculate days difference
-            days_diff = (patient_anns['annotation_date'] - exam_date).dt.days.abs()
-            
-            # Check if any annotations within threshold
-            matching_anns = (days_diff <= MAX_ANNOTATION_DAYS_DIFFERENCE).sum()
-            
-            if matching_anns > 0:
-                merged_df.at[idx, 'has_annotations'] = True
-                merged_df.at[idx, 'annotations_count'] = matching_anns
-                matches_found += 1
+    # Window-independent columns: the app re-derives has_annotations for the configured window
+    nearest, counts = match_distance_profile(
+        merged_df['maskedid'], merged_df['exam_date'],
+        annotations_df['maskedid'], annotations_df['annotation_date'],
+        ANNOTATION_COUNT_WINDOWS, workers, "Annotations distance profile"
+    )
+    merged_df = add_distance_columns(merged_df, 'annotation_nearest_days', 'annotations', nearest, counts, ANNOTATION_COUNT_WINDOWS)
     
+    print(f"  Matched {len(merged_df):,} rows against {len(annotations_df):,} annotations in {time.time() - start_time:.1f}s")
     print(f"Found {merged_df['has_annotations'].sum():,} images with matching annotations ({100*merged_df['has_annotations'].sum()/len(merged_df):.2f}%)")
+    return merged_df, records
+
+def annotation_context_keys(df):
+    """Stable 64-bit key of (maskedid, exam_date) - shared by all photos of one exam"""
+    return pd.util.hash_pandas_object(df[['maskedid', 'exam_date']], index=False).to_numpy()
+
+def build_annotation_context(annotations_df, records):
+    """
+    Side table with the closest-date annotations of every exam context
+    (same rule as DataLoader.get_annotations), keyed and sorted by `annotation_ctx`
+    """
+    print("\nBuilding annotation context table...")
+    contexts, positions, days_diff = records
+    
+    source = annotations_df.iloc[positions]
+    context_df = pd.DataFrame({
+        'annotation_ctx': contexts,
+        'examfield': source['examfield'].to_numpy() if 'examfield' in source.columns else 'Unknown',
+        'value': source['value'].to_numpy() if 'value' in source.columns else 'N/A',
+        'annotation_date': source['annotation_date'].to_numpy(),
+        'days_diff': days_diff.astype('int64'),
+        'laterality': source['laterality'].to_numpy() if 'laterality' in source.columns else 'Unknown'
+    })
+    
+    print(f"  {len(context_df):,} annotation records for {len(np.unique(contexts)):,} exam contexts")
+    return context_df
+
+def encode_string_columns(merged_df):
+    """
+    Store the (already normalized) key and path columns as categoricals, written
+    as parquet dictionaries - the app loads them without going through object strings
+    """
+    for col in DICTIONARY_COLUMNS:
+        if col in merged_df.columns:
+            merged_df[col] = merged_df[col].astype('category')
     return merged_df
 
-def save_preprocessed_data(merged_df, output_path):
-    """Save preprocessed dataset"""
+def save_preprocessed_data(merged_df, output_path, fingerprints):
+    """Save preprocessed dataset (with source fingerprints for incremental runs)"""
     print(f"\nSaving preprocessed dataset to {output_path}...")
-    
-    # Save as parquet for efficiency
-    merged_df.to_parquet(output_path, index=False, compression='gzip')
+    merged_df = encode_string_columns(merged_df)
+    
+    # Partitioned by has_notes/has_annotations so each filter mode reads only its rows
+    build_info = {
+        'version': PREPROCESSING_VERSION,
+        'fingerprints': fingerprints,
+        'max_note_days_difference': MAX_NOTE_DAYS_DIFFERENCE,
+        'max_annotation_days_difference': MAX_ANNOTATION_DAYS_DIFFERENCE
+    }
+    write_partitioned_dataset(merged_df, output_path, {PREPROCESSED_METADATA_KEY: json.dumps(build_info).encode()})
     
     # Also save summary statistics
     summary = {
@@ -223,30 +446,287 @@ def save_preprocessed_data(merged_df, output_path):
     print(f"Summary saved to {summary_path}")
     return summary
 
-def main():
+def write_parquet(df, output_path, compression='gzip', **build_info):
+    """Write a parquet file with the preprocessing parameters stored in its schema metadata"""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[PREPROCESSED_METADATA_KEY] = json.dumps(build_info).encode()
+    pq.write_table(table.replace_schema_metadata(metadata), output_path, compression=compression)
+
+def save_annotation_context(context_df, output_path):
+    """Save the per-exam annotation context side table"""
+    print(f"\nSaving annotation context table to {output_path}...")
+    write_parquet(
+        context_df,
+        output_path,
+        max_annotation_days_difference=MAX_ANNOTATION_DAYS_DIFFERENCE
+    )
+    print(f"Annotation context saved ({len(context_df):,} records)")
+
+def save_note_context(context_df, output_path):
+    """Save the notes referenced by the closest-note pointers"""
+    print(f"\nSaving note context table to {output_path}...")
+    write_parquet(
+        context_df,
+        output_path,
+        max_note_days_difference=MAX_NOTE_DAYS_DIFFERENCE
+    )
+    print(f"Note context saved ({len(context_df):,} notes)")
+
+def save_note_store(store_path):
+    """Write every Progress Note text into the compressed, deduplicated blob store"""
+    print(f"\nWriting note text store to {store_path}...")
+    stats = write_note_store(ANONYMIZED_EHR_PATH, store_path)
+    print(f"Note text store saved ({stats['notes']:,} notes, {stats['unique_texts']:,} unique texts, "
+          f"{stats['raw_bytes'] / (1024*1024):.1f} MB -> {stats['stored_bytes'] / (1024*1024):.1f} MB)")
+
+def save_notes_index(notes_df, output_path):
+    """Write the per-patient CSR notes index used by DataLoader.get_closest_notes"""
+    print(f"\nWriting notes index to {output_path}...")
+    index = build_notes_index(notes_df)
+    write_notes_index(index, output_path)
+    print(f"Notes index saved ({len(index['patients']):,} patients, {len(index['note_ids']):,} notes)")
+
+def save_annotations_index(annotations_df, output_path):
+    """Write the per-visit annotations index used by DataLoader.get_annotations"""
+    print(f"\nWriting annotations index to {output_path}...")
+    index_df = build_annotations_index(annotations_df)
+    write_annotations_index(index_df, output_path)
+    print(f"Annotations index saved ({index_df['maskedid'].nunique():,} maskedids, {len(index_df):,} annotations)")
+
+def compute_matches(merged_df, notes_df, annotations_df, workers=1):
+    """
+    Compute all note/annotation match columns for the given base rows
+    Returns: (merged_df, note_context_df, annotation_context_df)
+    """
+    # Add notes flags
+    merged_df, first, second = add_notes_flags(merged_df, notes_df, workers)
+    
+    # Store closest notes per image (used by the app instead of grouping all notes)
+    merged_df, note_positions = add_closest_note_pointers(merged_df, notes_df, first, second)
+    note_context_df = build_note_context(notes_df, note_positions)
+    
+    # Add annotations flags
+    merged_df, annotation_records = add_annotations_flags(merged_df, annotations_df, workers)
+    
+    # Closest annotations per exam (used by the app instead of ANNOTATIONS_PATH)
+    annotation_context_df = build_annotation_context(annotations_df, annotation_records)
+    
+    return merged_df, note_context_df, annotation_context_df
+
+def fingerprint_sources():
+    """Cheap fingerprint (path, size, mtime) of every input file"""
+    fingerprints = {}
+    for name, path in SOURCE_PATHS.items():
+        stat = Path(path).stat()
+        fingerprints[name] = {'path': str(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    return fingerprints
+
+def group_digests(df, key_column, value_columns):
+    """
+    Order-independent digest of each key's rows (sum of row hashes, mod 2**64)
+    Detects added, removed and edited notes/annotations per patient
+    """
+    columns = [key_column] + [col for col in value_columns if col in df.columns]
+    row_hashes = pd.util.hash_pandas_object(df[columns], index=False)
+    return row_hashes.groupby(df[key_column].to_numpy()).sum()
+
+def notes_digests(notes_df):
+    """Per-patient digest of the Progress Notes (note id, date and text hash)"""
+    return group_digests(notes_df, 'pat_mrn', ['note_id', 'note_date', 'note_text_hash'])
+
+def annotations_digests(annotations_df):
+    """Per-maskedid digest of the annotation records"""
+    return group_digests(annotations_df, 'maskedid', ['annotation_date', 'examfield', 'value', 'laterality'])
+
+def changed_keys(old_digests, new_digests):
+    """Keys that were added, removed or whose digest changed"""
+    joined = pd.concat([old_digests.rename('old'), new_digests.rename('new')], axis=1)
+    return set(joined.index[joined['old'] != joined['new']])
+
+def save_digests(notes_digest, annotations_digest, output_path):
+    """Persist per-patient/per-maskedid digests for the next incremental run"""
+    digests_df = pd.concat([
+        pd.DataFrame({'source': 'notes', 'key': notes_digest.index.astype(str), 'digest': notes_digest.to_numpy()}),
+        pd.DataFrame({'source': 'annotations', 'key': annotations_digest.index.astype(str), 'digest': annotations_digest.to_numpy()})
+    ], ignore_index=True)
+    digests_df.to_parquet(output_path, index=False)
+
+def load_digests(output_path):
+    """Load the digests saved by the previous run"""
+    digests_df = pd.read_parquet(output_path)
+    digests = {}
+    for source in ('notes', 'annotations'):
+        subset = digests_df[digests_df['source'] == source]
+        digests[source] = pd.Series(subset['digest'].to_numpy(), index=subset['key'].to_numpy(), dtype='uint64')
+    return digests
+
+def load_previous_build(output_path, digests_path):
+    """
+    Load the previous preprocessed dataset if it can be updated incrementally
+    Returns: (previous_df, build_info, digests) or None
+    """
+    if not output_path.exists() or not digests_path.exists():
+        return None
+    
+    build_info = read_build_info(output_path, PREPROCESSED_METADATA_KEY)
+    if 'fingerprints' not in build_info or build_info.get('version') != PREPROCESSING_VERSION:
+        print("  Previous dataset was built by another version of this script - full rebuild")
+        return None
+    if (build_info.get('max_note_days_difference') != MAX_NOTE_DAYS_DIFFERENCE or
+            build_info.get('max_annotation_days_difference') != MAX_ANNOTATION_DAYS_DIFFERENCE):
+        print("  Day windows changed since the previous run - full rebuild")
+        return None
+    
+    return read_dataset(output_path), build_info, load_digests(digests_path)
+
+def merge_incremental(base_df, previous_df, dirty, updated_df, output_dir, note_context_df, annotation_context_df):
+    """
+    Combine recomputed rows with the unchanged rows of the previous build
+    Returns: (merged_df, note_context_df, annotation_context_df)
+    """
+    match_columns = [col for col in previous_df.columns if col not in base_df.columns]
+    
+    # Unchanged rows: take match columns from the previous build (by row hash)
+    previous_matches = previous_df.drop_duplicates('row_hash').set_index('row_hash')[match_columns]
+    merged_df = base_df[~dirty].join(previous_matches, on='row_hash')
+    if updated_df is not None:
+        merged_df = pd.concat([merged_df, updated_df.set_axis(base_df.index[dirty])]).sort_index()
+    
+    # Side tables: replace recomputed entries, drop entries nothing points to anymore
+    previous_notes = pd.read_parquet(output_dir / 'preprocessed_notes.parquet')
+    note_context_df = pd.concat([note_context_df, previous_notes]).drop_duplicates('note_id')
+    referenced_notes = pd.concat([merged_df['note_id_1'], merged_df['note_id_2']]).dropna().unique()
+    note_context_df = note_context_df[note_context_df['note_id'].isin(referenced_notes)].reset_index(drop=True)
+    
+    previous_annotations = pd.read_parquet(output_dir / 'preprocessed_annotations.parquet')
+    if updated_df is not None:
+        previous_annotations = previous_annotations[
+            ~previous_annotations['annotation_ctx'].isin(updated_df['annotation_ctx'])
+        ]
+    annotation_context_df = pd.concat([annotation_context_df, previous_annotations], ignore_index=True)
+    referenced_contexts = merged_df.loc[merged_df['has_annotations'], 'annotation_ctx'].unique()
+    annotation_context_df = annotation_context_df[annotation_context_df['annotation_ctx'].isin(referenced_contexts)]
+    annotation_context_df = annotation_context_df.sort_values('annotation_ctx', kind='stable').reset_index(drop=True)
+    
+    return merged_df.reset_index(drop=True), note_context_df, annotation_context_df
+
+def parse_args(argv=None):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Create the preprocessed slitlamp dataset")
+    parser.add_argument(
+        '--full',
+        action='store_true',
+        help="Ignore the previous build and recompute every row"
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help="Shard the notes/annotations joins over N processes (hash-partitioned by pat_mrn / maskedid)"
+    )
+    return parser.parse_args(argv)
+
+def main(argv=None):
     """Main preprocessing function"""
+    args = parse_args(argv)
+    
     print("="*60)
     print("SLITLAMP DATASET PREPROCESSING")
     print("="*60)
     
-    # Load data
-    diagnosis_df, notes_df, cross_df, annotations_df = load_all_data()
+    output_dir = Path(__file__).parent.parent / 'data'
+    output_dir.mkdir(exist_ok=True)
+    output_path = output_dir / 'preprocessed_dataset.parquet'
+    digests_path = output_dir / 'preprocessed_digests.parquet'
+    note_store_path = output_dir / 'note_texts.bin'
+    notes_index_path = output_dir / 'notes_index.npz'
+    annotations_index_path = output_dir / 'annotations_index.parquet'
+    
+    # Fingerprint the inputs and compare with the previous build
+    fingerprints = fingerprint_sources()
+    previous = None if args.full else load_previous_build(output_path, digests_path)
+    note_files_missing = not all(
+        path.exists() for path in (note_store_path, Path(note_store_index_path(note_store_path)), notes_index_path)
+    )
+    annotations_index_missing = not annotations_index_path.exists()
+    
+    if (previous is not None and previous[1]['fingerprints'] == fingerprints
+            and not note_files_missing and not annotations_index_missing):
+        print("\nSource files unchanged since the previous run - nothing to do.")
+        return
     
-    # Merge base data
+    print("Loading datasets...")
+    diagnosis_df = load_diagnosis_data()
+    cross_df = load_crosswalk_data()
     merged_df = merge_base_data(cross_df, diagnosis_df)
     
-    # Add notes flags
-    merged_df = add_notes_flags(merged_df, notes_df)
-    
-    # Add annotations flags
-    merged_df = add_annotations_flags(merged_df, annotations_df)
+    if previous is None:
+        # Full build
+        notes_df = load_notes_data()
+        annotations_df = load_annotations_data()
+        notes_digest = notes_digests(notes_df)
+        annotations_digest = annotations_digests(annotations_df)
+        
+        all_notes_df, all_annotations_df = notes_df, annotations_df
+        merged_df, note_context_df, annotation_context_df = compute_matches(merged_df, notes_df, annotations_df, args.workers)
+    else:
+        # Incremental build: only new/changed rows and rows of patients whose notes/annotations changed
+        previous_df, build_info, digests = previous
+        changed = {name for name in fingerprints if fingerprints[name] != build_info['fingerprints'].get(name)}
+        print(f"\nIncremental update - changed sources: {', '.join(sorted(changed))}")
+        
+        dirty = ~merged_df['row_hash'].isin(previous_df['row_hash']).to_numpy()
+        
+        notes_df = annotations_df = all_notes_df = all_annotations_df = None
+        notes_digest, annotations_digest = digests['notes'], digests['annotations']
+        if 'notes' in changed:
+            notes_df = all_notes_df = load_notes_data()
+            notes_digest = notes_digests(notes_df)
+            changed_patients = changed_keys(digests['notes'], notes_digest)
+            print(f"  Patients with changed notes: {len(changed_patients):,}")
+            dirty |= merged_df['pat_mrn'].isin(changed_patients).to_numpy()
+        if 'annotations' in changed:
+            annotations_df = all_annotations_df = load_annotations_data()
+            annotations_digest = annotations_digests(annotations_df)
+            changed_ids = changed_keys(digests['annotations'], annotations_digest)
+            print(f"  maskedids with changed annotations: {len(changed_ids):,}")
+            dirty |= merged_df['maskedid'].isin(changed_ids).to_numpy()
+        
+        print(f"  Rows to recompute: {dirty.sum():,} / {len(merged_df):,}")
+        
+        updated_df = None
+        note_context_df = annotation_context_df = None
+        if dirty.any():
+            dirty_df = merged_df[dirty].reset_index(drop=True)
+            if notes_df is None:
+                notes_df = load_notes_data()
+            if annotations_df is None:
+                annotations_df = load_annotations_data()
+            all_notes_df, all_annotations_df = notes_df, annotations_df
+            
+            # Only the notes/annotations of the affected patients are needed
+            notes_df = notes_df[notes_df['pat_mrn'].isin(dirty_df['pat_mrn'])]
+            annotations_df = annotations_df[annotations_df['maskedid'].isin(dirty_df['maskedid'])]
+            updated_df, note_context_df, annotation_context_df = compute_matches(dirty_df, notes_df, annotations_df, args.workers)
+        
+        merged_df, note_context_df, annotation_context_df = merge_incremental(
+            merged_df, previous_df, dirty, updated_df, output_dir, note_context_df, annotation_context_df
+        )
     
     # Save preprocessed data
-    output_dir = Path(__file__).parent.parent / 'data'
-    output_dir.mkdir(exist_ok=True)
-    output_path = output_dir / 'preprocessed_dataset.parquet'
-    
-    summary = save_preprocessed_data(merged_df, str(output_path))
+    summary = save_preprocessed_data(merged_df, str(output_path), fingerprints)
+    save_annotation_context(annotation_context_df, str(output_dir / 'preprocessed_annotations.parquet'))
+    save_note_context(note_context_df, str(output_dir / 'preprocessed_notes.parquet'))
+    if previous is None or fingerprints['notes'] != previous[1]['fingerprints'].get('notes') or note_files_missing:
+        save_note_store(str(note_store_path))
+        save_notes_index(all_notes_df if all_notes_df is not None else load_notes_data(), notes_index_path)
+    if previous is None or fingerprints['annotations'] != previous[1]['fingerprints'].get('annotations') or annotations_index_missing:
+        save_annotations_index(
+            all_annotations_df if all_annotations_df is not None else load_annotations_data(),
+            str(annotations_index_path)
+        )
+    save_digests(notes_digest, annotations_digest, digests_path)
     
     print("\n" + "="*60)
     print("PREPROCESSING COMPLETE!")
@@ -257,7 +737,7 @@ def main():
     print(f"  With annotations: {summary['with_annotations']:,} ({100*summary['with_annotations']/summary['total_images']:.1f}%)")
     print(f"  With both: {summary['with_both']:,} ({100*summary['with_both']/summary['total_images']:.1f}%)")
     print(f"\nPreprocessed file: {output_path}")
-    print(f"File size: {output_path.stat().st_size / (1024*1024):.1f} MB")
+    print(f"File size: {sum(f.stat().st_size for f in output_path.rglob('*.parquet')) / (1024*1024):.1f} MB")
     print("\nYou can now use this preprocessed file in the main app!")
 
 if __name__ == "__main__":
@@ -0,0 +1,148 @@
+"""
+Read/write helpers for the partitioned preprocessed dataset
+
+The dataset is a directory (still named preprocessed_dataset.parquet) with hive
+partitions on the filter flags:
+
+    preprocessed_dataset.parquet/
+        _common_metadata                      (schema + preprocessing build info)
+        has_notes=true/has_annotations=true/part-0.parquet
+        has_notes=true/has_annotations=false/part-0.parquet
+        ...
+
+A filter mode reads only its own partitions. `row_id` keeps the original row
+order, which the labeling routes depend on. Older single-file outputs are
+read through the same functions (the flag filter then applies to the column).
+"""
+
+import os
+import json
+import shutil
+from pathlib import Path
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+PARTITION_COLUMNS = ['has_notes', 'has_annotations']
+
+# zstd decompresses several times faster than gzip at a similar ratio
+DATASET_COMPRESSION = 'zstd'
+ROWS_PER_GROUP = 64 * 1024
+
+# Partition filter per dataset filter mode
+FILTER_MODE_PARTITIONS = {
+    'ALL': {},
+    'NOTES': {'has_notes': True},
+    'ANNOTATIONS': {'has_annotations': True},
+    'NOTES_AND_ANNOTATIONS': {'has_notes': True, 'has_annotations': True}
+}
+
+
+def flag_partitioning():
+    """Hive partitioning on the boolean filter flags"""
+    return ds.partitioning(
+        pa.schema([(column, pa.bool_()) for column in PARTITION_COLUMNS]),
+        flavor='hive'
+    )
+
+
+def metadata_path(path):
+    """File holding the schema metadata (the dataset's _common_metadata, or the file itself)"""
+    path = Path(path)
+    return path / '_common_metadata' if path.is_dir() else path
+
+
+def read_build_info(path, metadata_key):
+    """Read the preprocessing parameters stored under metadata_key (empty dict if none)"""
+    metadata = pq.read_schema(metadata_path(path)).metadata or {}
+    if metadata_key not in metadata:
+        return {}
+    return json.loads(metadata[metadata_key])
+
+
+def write_partitioned_dataset(df, output_path, metadata):
+    """
+    Write df as a flag-partitioned dataset with row_id, replacing any previous output
+    metadata: schema metadata (bytes -> bytes) stored in _common_metadata
+    """
+    table = pa.Table.from_pandas(df.assign(row_id=range(len(df))), preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), **metadata})
+
+    # Write next to the old output, then swap it in
+    tmp_path = Path(f"{output_path}.tmp")
+    if tmp_path.exists():
+        shutil.rmtree(tmp_path)
+    ds.write_dataset(
+        table,
+        tmp_path,
+        format='parquet',
+        partitioning=flag_partitioning(),
+        basename_template='part-{i}.parquet',
+        file_options=ds.ParquetFileFormat().make_write_options(compression=DATASET_COMPRESSION),
+        max_rows_per_group=ROWS_PER_GROUP,
+        use_threads=False
+    )
+    pq.write_metadata(table.schema, tmp_path / '_common_metadata')
+
+    # Move the old output aside first, so the path is never left without a dataset
+    # while the old copy is deleted; it is removed only once the new one is in place
+    output_path = Path(output_path)
+    old_path = Path(f"{output_path}.old")
+    _remove_path(old_path)
+    if output_path.exists():
+        os.replace(output_path, old_path)
+    try:
+        os.replace(tmp_path, output_path)
+    except OSError:
+        if old_path.exists():
+            os.replace(old_path, output_path)
+        raise
+    try:
+        _remove_path(old_path)
+    except OSError as e:
+        print(f"⚠️  Could not remove the previous dataset {old_path} (removed on the next run): {e}")
+
+
+def _remove_path(path):
+    """Delete a dataset directory or legacy single file, if present"""
+    if path.is_dir():
+        shutil.rmtree(path)
+    elif path.exists():
+        path.unlink()
+
+
+def open_dataset(path):
+    """Open the dataset directory (or a legacy single file); _common_metadata is skipped by its prefix"""
+    if Path(path).is_dir():
+        return ds.dataset(path, format='parquet', partitioning=flag_partitioning())
+    return ds.dataset(path, format='parquet')
+
+
+def count_rows(path):
+    """Total rows, answered from the parquet footers"""
+    return open_dataset(path).count_rows()
+
+
+def read_dataset(path, partitions=None, columns=None):
+    """
+    Read the dataset, only the partitions matching `partitions` ({flag: value})
+    and only `columns` if given
+    Returns rows in their original order (row_id is dropped)
+    """
+    dataset = open_dataset(path)
+    row_filter = None
+    for column, value in (partitions or {}).items():
+        condition = ds.field(column) == value
+        row_filter = condition if row_filter is None else row_filter & condition
+
+    if columns is not None:
+        columns = [name for name in columns if name != 'row_id'] + (['row_id'] if 'row_id' in dataset.schema.names else [])
+    table = dataset.to_table(columns=columns, filter=row_filter)
+    df = table.to_pandas()
+    if 'row_id' in df.columns:
+        df = df.sort_values('row_id', kind='stable').drop(columns='row_id')
+
+    # Flags and columns in the written order (partition columns come back last)
+    metadata_schema = pq.read_schema(metadata_path(path))
+    columns = [name for name in metadata_schema.names if name in df.columns and name != 'row_id']
+    return df[columns].reset_index(drop=True)
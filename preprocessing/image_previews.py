@@ -0,0 +1,111 @@
+"""
+Downscaled image previews shared by the preview build stage and the app
+
+Previews are content-addressed: the files are named after the SHA-1 of the
+original image, so identical originals share them.
+
+    <preview dir>/
+        manifest.parquet                    image_path, size, mtime_ns, digest (+ settings in the schema metadata)
+        ab/abcdef..._256.jpg                thumbnail
+        ab/abcdef..._1280.jpg               display-size preview
+
+The manifest is keyed by source path, size and mtime, so a replaced original
+is processed again.
+"""
+
+import io
+import os
+import json
+import math
+import hashlib
+from pathlib import Path
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from PIL import Image, ImageOps
+
+ORIENTATION_TAG = 0x0112
+MANIFEST_NAME = 'manifest.parquet'
+MANIFEST_METADATA_KEY = b"slitlamp_previews"
+
+FORMAT_EXTENSIONS = {'JPEG': '.jpg', 'WEBP': '.webp', 'PNG': '.png'}
+
+
+def encode_image(source, width, image_format, quality):
+    """
+    Upright (EXIF orientation), downscaled (never upscaled) copy of an image, encoded as bytes
+    source: path or binary file object
+    """
+    with Image.open(source) as image:
+        # Let the JPEG decoder scale down by 1/2, 1/4 or 1/8 while decoding
+        # (the display width is the stored height for images rotated by 90 degrees)
+        rotated = image.getexif().get(ORIENTATION_TAG) in (5, 6, 7, 8)
+        scale = width / max(image.height if rotated else image.width, 1)
+        if scale < 1:
+            image.draft('RGB', (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+        image = ImageOps.exif_transpose(image)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        if image.width > width:
+            image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+
+        buffer = io.BytesIO()
+        image.save(buffer, format=image_format, quality=quality)
+        return buffer.getvalue()
+
+
+def preview_file(preview_dir, digest, width, image_format):
+    """Content-addressed path of one preview size of an original"""
+    return Path(preview_dir) / digest[:2] / f"{digest}_{width}{FORMAT_EXTENSIONS[image_format]}"
+
+
+def write_previews(source_path, preview_dir, widths, image_format, quality):
+    """
+    Read an original once and write its previews (sizes already present are kept)
+    Returns: SHA-1 hex digest of the original
+    """
+    data = Path(source_path).read_bytes()
+    digest = hashlib.sha1(data).hexdigest()
+
+    for width in widths:
+        path = preview_file(preview_dir, digest, width, image_format)
+        if path.exists():
+            continue
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_bytes(encode_image(io.BytesIO(data), width, image_format, quality))
+        os.replace(tmp_path, path)
+
+    return digest
+
+
+def preview_settings(widths, image_format, quality):
+    """Settings stored with the manifest; previews are only used by an app with the same settings"""
+    return {'widths': sorted(widths), 'format': image_format, 'quality': quality}
+
+
+def read_manifest(preview_dir):
+    """
+    Manifest of a preview directory
+    Returns: (DataFrame with image_path, size, mtime_ns, digest, settings dict) - empty if none
+    """
+    path = Path(preview_dir) / MANIFEST_NAME
+    if not path.exists():
+        return pd.DataFrame(columns=['image_path', 'size', 'mtime_ns', 'digest']), {}
+
+    table = pq.read_table(path)
+    metadata = table.schema.metadata or {}
+    settings = json.loads(metadata[MANIFEST_METADATA_KEY]) if MANIFEST_METADATA_KEY in metadata else {}
+    return table.to_pandas(), settings
+
+
+def write_manifest(manifest_df, preview_dir, settings):
+    """Write the manifest with its settings (replaced atomically)"""
+    path = Path(preview_dir) / MANIFEST_NAME
+    table = pa.Table.from_pandas(manifest_df, preserve_index=False)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        MANIFEST_METADATA_KEY: json.dumps(settings).encode()
+    })
+    pq.write_table(table, f"{path}.tmp")
+    os.replace(f"{path}.tmp", path)
@@ -0,0 +1,285 @@
+"""
+Vectorized interval-join helpers for the preprocessing script
+
+Instead of looping over every image row and filtering the patient's notes
+(or annotations) one group at a time, events are sorted once by
+(key, date) and each image row gets its window bounds from a binary search
+(np.searchsorted). Counting matches for ALL rows is then a single subtraction.
+"""
+
+import numpy as np
+import pandas as pd
+
+NS_PER_DAY = 86_400 * 10**9
+
+
+def to_ns(dates):
+    """Convert a datetime Series/array to int64 nanoseconds (NaT -> min int64)"""
+    values = pd.to_datetime(pd.Series(dates, copy=False)).to_numpy(dtype='datetime64[ns]')
+    return values.view('int64')
+
+
+def encode_keys(query_keys, event_keys):
+    """
+    Encode query and event keys against the same vocabulary
+    Returns: (query_codes, event_codes) as int64 arrays, -1 for keys without events
+    """
+    event_codes, uniques = pd.factorize(pd.Series(event_keys, copy=False))
+    query_codes = pd.Index(uniques).get_indexer(pd.Series(query_keys, copy=False))
+    return query_codes.astype('int64'), event_codes.astype('int64')
+
+
+def day_window_ns(max_days):
+    """
+    Window offsets (in ns) matching `(event_date - exam_date).dt.days.abs() <= max_days`
+
+    `.dt.days` floors towards -inf, so an event matches when
+    -max_days days <= diff < (max_days + 1) days (half-open on the right).
+    """
+    return -max_days * NS_PER_DAY, (max_days + 1) * NS_PER_DAY
+
+
+class SortedEvents:
+    """Events (notes or annotations) sorted by (key code, date, original position)"""
+
+    def __init__(self, event_codes, event_ns):
+        valid = (event_codes >= 0) & (event_ns != np.iinfo('int64').min)
+        positions = np.flatnonzero(valid)
+        order = np.lexsort((positions, event_ns[positions], event_codes[positions]))
+
+        # Original row position of each sorted event (for fetching columns later)
+        self.positions = positions[order]
+        self.codes = event_codes[self.positions]
+        self.ns = event_ns[self.positions]
+
+    def __len__(self):
+        return len(self.positions)
+
+    def locate(self, query_codes, *query_ns):
+        """
+        For each boundary array, find the position of the first sorted event
+        with the same key and date >= boundary, for every query at once.
+
+        Dates are replaced by their rank among all event and boundary dates, so
+        (code, rank) packs into one int64 that is globally sorted and can be
+        searched with a single np.searchsorted call.
+        """
+        ranks = np.unique(np.concatenate([self.ns, *query_ns]))
+        width = np.int64(len(ranks) + 1)
+
+        event_key = self.codes * width + np.searchsorted(ranks, self.ns)
+        # Queries without events (code -1) land below every event key -> empty slice
+        return [
+            np.searchsorted(event_key, query_codes * width + np.searchsorted(ranks, ns), side='left')
+            for ns in query_ns
+        ]
+
+    def bounds(self, query_codes, query_lo_ns, query_hi_ns):
+        """Find [lo, hi) slices of sorted events with the same key and query_lo_ns <= date < query_hi_ns"""
+        lo, hi = self.locate(query_codes, query_lo_ns, query_hi_ns)
+        return lo, np.maximum(hi, lo)
+
+
+def prepare_queries(query_keys, query_dates, event_keys, event_dates):
+    """
+    Build the sorted event index and encode the queries against it
+    Returns: (events, query_codes, query_ns) - queries with a missing date get code -1
+    """
+    query_codes, event_codes = encode_keys(query_keys, event_keys)
+    events = SortedEvents(event_codes, to_ns(event_dates))
+
+    query_ns = to_ns(query_dates)
+    missing = query_ns == np.iinfo('int64').min
+    query_codes = np.where(missing, -1, query_codes)
+    query_ns = np.where(missing, 0, query_ns)
+    return events, query_codes, query_ns
+
+
+def window_bounds(query_keys, query_dates, event_keys, event_dates, max_days):
+    """
+    Compute window bounds for every query row in one vectorized pass
+    Returns: (events, lo, hi) where events is the SortedEvents index and
+    events.positions[lo[i]:hi[i]] are the matching event rows for query i
+    """
+    events, query_codes, query_ns = prepare_queries(query_keys, query_dates, event_keys, event_dates)
+
+    before_ns, after_ns = day_window_ns(max_days)
+    lo, hi = events.bounds(query_codes, query_ns + before_ns, query_ns + after_ns)
+    return events, lo, hi
+
+
+def count_in_window(query_keys, query_dates, event_keys, event_dates, max_days):
+    """Count events with the same key within max_days of each query date"""
+    _, lo, hi = window_bounds(query_keys, query_dates, event_keys, event_dates, max_days)
+    return (hi - lo).astype('int64')
+
+
+def expand_bounds(lo, hi):
+    """
+    Expand [lo, hi) slices into flat pairs
+    Returns: (query_idx, sorted_event_idx) with one entry per matching event
+    """
+    lengths = hi - lo
+    query_idx = np.repeat(np.arange(len(lo)), lengths)
+    starts = np.repeat(lo - (np.cumsum(lengths) - lengths), lengths)
+    return query_idx, starts + np.arange(lengths.sum())
+
+
+def floor_days(event_ns, query_ns):
+    """Signed day difference with the same flooring as `(event - query).dt.days`"""
+    return np.floor_divide(event_ns - query_ns, NS_PER_DAY)
+
+
+def segment_min(values, segment_ids):
+    """Broadcast the minimum of `values` over each run of equal (sorted) segment_ids"""
+    if len(values) == 0:
+        return values
+    starts = np.flatnonzero(np.r_[True, segment_ids[1:] != segment_ids[:-1]])
+    run_lengths = np.diff(np.r_[starts, len(values)])
+    return np.repeat(np.minimum.reduceat(values, starts), run_lengths)
+
+
+def first_two_positions(positions, segment_ids, n_segments):
+    """
+    Smallest and second smallest original position per segment
+    Returns: (first, second) arrays of length n_segments, -1 where missing
+    """
+    first = np.full(n_segments, -1, dtype='int64')
+    second = np.full(n_segments, -1, dtype='int64')
+    if len(positions) == 0:
+        return first, second
+
+    order = np.lexsort((positions, segment_ids))
+    positions, segment_ids = positions[order], segment_ids[order]
+    starts = np.flatnonzero(np.r_[True, segment_ids[1:] != segment_ids[:-1]])
+    first[segment_ids[starts]] = positions[starts]
+
+    has_second = np.r_[starts[1:], len(positions)] - starts > 1
+    second[segment_ids[starts[has_second]]] = positions[starts[has_second] + 1]
+    return first, second
+
+
+def day_positions(events, query_codes, exam_ns, anchor):
+    """
+    First two original positions among the notes on the same day difference
+    (relative to the exam) as the sorted event at `anchor`, for every query
+    Returns: (first, second) as in first_two_positions
+    """
+    closest_days = floor_days(events.ns[anchor], exam_ns)
+    day_start, day_end = events.locate(
+        query_codes,
+        exam_ns + closest_days * NS_PER_DAY,
+        exam_ns + (closest_days + 1) * NS_PER_DAY
+    )
+    query_idx, sorted_idx = expand_bounds(day_start, day_end)
+    return first_two_positions(events.positions[sorted_idx], query_idx, len(anchor))
+
+
+def resolve_notes(row_keys, row_dates, note_keys, note_dates, max_days):
+    """
+    Notes join for a set of image rows, following DataLoader.get_closest_notes:
+    - exam between two notes -> closest note before and closest note after
+      (the first in original order of the closest day on each side)
+    - otherwise -> the closest note(s) (first two in original order)
+    Returns: (notes_count, first, second) - first/second are positions into
+    the given notes, -1 if none
+    """
+    first = np.full(len(row_keys), -1, dtype='int64')
+    second = np.full(len(row_keys), -1, dtype='int64')
+    if len(note_keys) == 0:
+        return np.zeros(len(row_keys), dtype='int64'), first, second
+
+    events, query_codes, exam_ns = prepare_queries(row_keys, row_dates, note_keys, note_dates)
+    before_ns, after_ns = day_window_ns(max_days)
+
+    # lo..same_day_start: notes before, same_day_start..after_start: same day, after_start..hi: after
+    lo, same_day_start, after_start, hi = events.locate(
+        query_codes,
+        exam_ns + before_ns,
+        exam_ns,
+        exam_ns + NS_PER_DAY,
+        exam_ns + after_ns
+    )
+    hi = np.maximum(hi, lo)
+    has_before = same_day_start > lo
+    has_after = hi > after_start
+    has_same_day = after_start > same_day_start
+    between = has_before & has_after
+
+    # Exam between two notes: closest day before and closest day after
+    first[between], _ = day_positions(events, query_codes[between], exam_ns[between], same_day_start[between] - 1)
+    second[between], _ = day_positions(events, query_codes[between], exam_ns[between], after_start[between])
+
+    # Otherwise: all notes sharing the smallest day difference
+    single = ~between & (hi > lo)
+    anchor = np.where(has_same_day, same_day_start, np.where(has_after, after_start, same_day_start - 1))[single]
+    first[single], second[single] = day_positions(events, query_codes[single], exam_ns[single], anchor)
+
+    return (hi - lo).astype('int64'), first, second
+
+
+def resolve_annotations(row_keys, row_dates, row_contexts, annotation_keys, annotation_dates, max_days):
+    """
+    Annotations join for a set of image rows, following DataLoader.get_annotations
+    Returns: (annotations_count, record_contexts, record_positions, record_days_diff)
+    with one record per closest-date annotation of each exam context, sorted by
+    (context, original annotation position)
+    """
+    events, lo, hi = window_bounds(row_keys, row_dates, annotation_keys, annotation_dates, max_days)
+    annotations_count = (hi - lo).astype('int64')
+
+    # One query per exam context that has at least one annotation in the window
+    row_contexts = np.asarray(row_contexts)
+    matched = np.flatnonzero(annotations_count > 0)
+    _, unique_idx = np.unique(row_contexts[matched], return_index=True)
+    contexts = matched[np.sort(unique_idx)]
+
+    ctx_idx, sorted_idx = expand_bounds(lo[contexts], hi[contexts])
+    days_diff = floor_days(events.ns[sorted_idx], to_ns(row_dates)[contexts][ctx_idx])
+
+    # Keep only the closest annotation date per context
+    abs_days = np.abs(days_diff)
+    keep = abs_days == segment_min(abs_days, ctx_idx)
+
+    record_contexts = row_contexts[contexts][ctx_idx[keep]]
+    record_positions = events.positions[sorted_idx[keep]]
+    order = np.lexsort((record_positions, record_contexts))
+    return annotations_count, record_contexts[order], record_positions[order], days_diff[keep][order]
+
+
+def distance_profile(query_keys, query_dates, event_keys, event_dates, windows):
+    """
+    Window-independent match summary for every query row:
+    - nearest absolute day distance to an event with the same key (same flooring
+      as `.dt.days.abs()`), so `nearest <= max_days` equals "has a match"
+    - event counts within each of the given day windows
+    Returns: (nearest_days, counts) - nearest_days is -1 when the key has no dated
+    events, counts has one column per window
+    """
+    nearest = np.full(len(query_keys), -1, dtype='int64')
+    counts = np.zeros((len(query_keys), len(windows)), dtype='int64')
+    if len(event_keys) == 0:
+        return nearest, counts
+
+    events, query_codes, query_ns = prepare_queries(query_keys, query_dates, event_keys, event_dates)
+    if len(events) == 0:
+        return nearest, counts
+
+    window_ns = [query_ns + offset for window in windows for offset in day_window_ns(window)]
+    first_after, *window_bounds_ = events.locate(query_codes, query_ns, *window_ns)
+
+    # Closest candidates: first event at/after the exam and last event before it (same key)
+    after = np.minimum(first_after, len(events) - 1)
+    before = np.maximum(first_after - 1, 0)
+    has_after = (first_after < len(events)) & (events.codes[after] == query_codes)
+    has_before = (first_after > 0) & (events.codes[before] == query_codes)
+
+    after_days = np.where(has_after, floor_days(events.ns[after], query_ns), np.iinfo('int64').max)
+    before_days = np.where(has_before, -floor_days(events.ns[before], query_ns), np.iinfo('int64').max)
+    closest = np.minimum(after_days, before_days)
+    nearest[has_after | has_before] = closest[has_after | has_before]
+
+    for i in range(len(windows)):
+        lo, hi = window_bounds_[2 * i], window_bounds_[2 * i + 1]
+        counts[:, i] = np.maximum(hi - lo, 0)
+    return nearest, counts
@@ -0,0 +1,178 @@
+"""
+On-disk store for Progress Note texts
+
+Written once by the preprocessing script, read by the app through a memory map:
+- note_texts.bin: zlib-compressed texts back to back, identical texts stored once
+  (deduplicated by content hash)
+- note_texts.index.parquet: note_id -> (offset, length) into the blob, sorted by note_id
+
+Looking up a note reads and decompresses only its own bytes, so the app never
+keeps note texts in memory.
+"""
+
+import os
+import mmap
+import zlib
+import sqlite3
+import hashlib
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from preprocessing.notes_reader import scan_notes
+
+COMPRESSION_LEVEL = 6
+
+# Digests per SQLite lookup (below the default host parameter limit)
+DEDUP_LOOKUP_CHUNK = 900
+
+
+def note_store_index_path(store_path):
+    """Offset table that goes with a blob file"""
+    return str(store_path).removesuffix('.bin') + '.index.parquet'
+
+
+def _known_locations(conn, digests):
+    """(offset, length) of the digests already in the blob, looked up in chunks"""
+    known = {}
+    for start in range(0, len(digests), DEDUP_LOOKUP_CHUNK):
+        chunk = digests[start:start + DEDUP_LOOKUP_CHUNK]
+        rows = conn.execute(
+            f"SELECT digest, offset, length FROM blobs WHERE digest IN ({','.join('?' * len(chunk))})", chunk
+        )
+        known.update((digest, (offset, length)) for digest, offset, length in rows)
+    return known
+
+
+def write_note_store(notes_path, store_path):
+    """
+    Stream all Progress Note texts into the blob store
+    Memory stays bounded by one record batch: the content-hash dedup table is a
+    temporary SQLite file and the index is written batch by batch, then sorted
+    by Arrow (columnar, no Python objects per note)
+    Returns: dict with counts and sizes for the summary output
+    """
+    index_path = note_store_index_path(store_path)
+    dedup_path = f"{store_path}.dedup.tmp"
+    unsorted_path = f"{index_path}.unsorted.tmp"
+    for path in (dedup_path, unsorted_path):
+        if os.path.exists(path):
+            os.remove(path)
+
+    conn = sqlite3.connect(dedup_path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("CREATE TABLE blobs (digest BLOB PRIMARY KEY, offset INTEGER, length INTEGER) WITHOUT ROWID")
+
+    offset = 0
+    raw_bytes = 0
+    unique_texts = 0
+    writer = None
+    try:
+        with open(f"{store_path}.tmp", 'wb') as f:
+            for batch in scan_notes(notes_path, ['note_id', 'note_text']):
+                texts = batch.column('note_text').to_pylist()
+                raws = [None if text is None else text.encode('utf-8') for text in texts]
+                digests = [None if raw is None else hashlib.blake2b(raw, digest_size=16).digest() for raw in raws]
+
+                locations = _known_locations(conn, list({digest for digest in digests if digest is not None}))
+                new_rows = []
+                offsets = np.full(len(raws), -1, dtype='int64')
+                lengths = np.zeros(len(raws), dtype='int64')
+                for position, (raw, digest) in enumerate(zip(raws, digests)):
+                    if raw is None:
+                        continue
+                    if digest not in locations:
+                        blob = zlib.compress(raw, COMPRESSION_LEVEL)
+                        f.write(blob)
+                        locations[digest] = (offset, len(blob))
+                        new_rows.append((digest, offset, len(blob)))
+                        offset += len(blob)
+                        raw_bytes += len(raw)
+                    offsets[position], lengths[position] = locations[digest]
+                conn.executemany("INSERT INTO blobs (digest, offset, length) VALUES (?, ?, ?)", new_rows)
+                unique_texts += len(new_rows)
+
+                index_batch = pa.table({
+                    'note_id': batch.column('note_id'),
+                    'offset': offsets,
+                    'length': lengths
+                })
+                if writer is None:
+                    writer = pq.ParquetWriter(unsorted_path, index_batch.schema)
+                writer.write_table(index_batch)
+    finally:
+        if writer is not None:
+            writer.close()
+        conn.close()
+        os.remove(dedup_path)
+
+    # Sort by note_id (stable, so the first occurrence of a duplicated id is kept) and drop repeats
+    if writer is not None:
+        index_table = pq.read_table(unsorted_path)
+        os.remove(unsorted_path)
+        index_table = index_table.filter(pc.is_valid(index_table['note_id']))
+        index_table = index_table.take(pc.sort_indices(index_table, sort_keys=[('note_id', 'ascending')]))
+        note_ids = index_table['note_id'].combine_chunks()
+        if len(note_ids) > 1:
+            first = pc.not_equal(note_ids.slice(1), note_ids.slice(0, len(note_ids) - 1))
+            index_table = index_table.filter(pa.concat_arrays([pa.array([True]), first]))
+    else:
+        index_table = pa.table({
+            'note_id': pa.array([], type=pa.int64()),
+            'offset': pa.array([], type=pa.int64()),
+            'length': pa.array([], type=pa.int64())
+        })
+    pq.write_table(index_table, f"{index_path}.tmp")
+
+    # Swap both files in only once they are complete
+    os.replace(f"{store_path}.tmp", store_path)
+    os.replace(f"{index_path}.tmp", index_path)
+
+    return {
+        'notes': index_table.num_rows,
+        'unique_texts': unique_texts,
+        'raw_bytes': raw_bytes,
+        'stored_bytes': offset
+    }
+
+
+class NoteTextStore:
+    """Read-only, memory-mapped access to the note text blob store"""
+
+    def __init__(self, store_path):
+        index_df = pd.read_parquet(note_store_index_path(store_path))
+        self.note_ids = index_df['note_id'].to_numpy()
+        self.offsets = index_df['offset'].to_numpy()
+        self.lengths = index_df['length'].to_numpy()
+
+        self._file = open(store_path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+    def __len__(self):
+        return len(self.note_ids)
+
+    def _position(self, note_id):
+        position = np.searchsorted(self.note_ids, note_id)
+        if position < len(self.note_ids) and self.note_ids[position] == note_id:
+            return position
+        return None
+
+    def __contains__(self, note_id):
+        return self._position(note_id) is not None
+
+    def get(self, note_id):
+        """Text of one note (None if the note is unknown or has no text)"""
+        position = self._position(note_id)
+        if position is None or self.offsets[position] < 0:
+            return None
+        start = self.offsets[position]
+        return zlib.decompress(self._map[start:start + self.lengths[position]]).decode('utf-8')
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
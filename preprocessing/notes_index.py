@@ -0,0 +1,128 @@
+"""
+Persisted CSR index of the Progress Notes for per-patient lookups
+
+Notes are sorted by (pat_mrn, note_date, original order) and stored as flat
+arrays, with one offsets entry per patient:
+
+    patients[i]                      -> i-th pat_mrn (sorted)
+    offsets[i]:offsets[i + 1]        -> that patient's slice of the arrays below
+    note_dates / note_ids / positions
+
+A lookup is a binary search for the patient plus two binary searches over the
+patient's datetime slice - no groupby at startup and no DataFrame per call.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+from preprocessing.notes_reader import normalize_note_ids
+
+NS_PER_DAY = 86_400 * 10**9
+
+
+def build_notes_index(notes_df):
+    """
+    Build the CSR arrays from the Progress Notes (pat_mrn, note_date, note_id)
+    Returns: dict of numpy arrays (see module docstring)
+    """
+    notes = notes_df[['pat_mrn', 'note_date', 'note_id']].assign(position=np.arange(len(notes_df)))
+    # Notes without an id cannot be looked up in the note text store
+    notes = notes.dropna(subset=['pat_mrn', 'note_date', 'note_id'])
+    notes = notes.sort_values(['pat_mrn', 'note_date', 'position'], kind='stable')
+
+    pat_mrns = notes['pat_mrn'].to_numpy(dtype=str)
+    patients, starts = np.unique(pat_mrns, return_index=True)
+    note_ids = normalize_note_ids(notes['note_id'])
+    if pd.api.types.is_integer_dtype(note_ids):
+        note_ids = note_ids.to_numpy(dtype='int64')
+    else:
+        note_ids = note_ids.to_numpy(dtype=str)
+
+    return {
+        'patients': patients,
+        'offsets': np.append(starts, len(notes)).astype('int64'),
+        'note_dates': notes['note_date'].to_numpy(dtype='datetime64[ns]'),
+        'note_ids': note_ids,
+        'positions': notes['position'].to_numpy(dtype='int64')
+    }
+
+
+def write_notes_index(index, output_path):
+    """Write the CSR arrays to an .npz file (replaced atomically)"""
+    tmp_path = f"{output_path}.tmp.npz"
+    np.savez(tmp_path, **index)
+    os.replace(tmp_path, output_path)
+
+
+class NotesIndex:
+    """Read-only CSR notes index loaded from the .npz written by preprocessing"""
+
+    def __init__(self, path):
+        with np.load(path, allow_pickle=False) as arrays:
+            self.patients = arrays['patients']
+            self.offsets = arrays['offsets']
+            self.note_dates = arrays['note_dates']
+            self.note_ns = self.note_dates.view('int64')
+            self.note_ids = arrays['note_ids']
+            self.positions = arrays['positions']
+
+    def __len__(self):
+        return len(self.note_ids)
+
+    def patient_slice(self, pat_mrn):
+        """(start, end) of the patient's notes, (0, 0) if unknown"""
+        i = np.searchsorted(self.patients, pat_mrn)
+        if i < len(self.patients) and self.patients[i] == pat_mrn:
+            return self.offsets[i], self.offsets[i + 1]
+        return 0, 0
+
+    def closest_notes(self, pat_mrn, exam_date, max_days):
+        """
+        Same rule as DataLoader.get_closest_notes:
+        - exam between two notes -> closest note before and closest note after
+          (the first in original order of the closest day on each side)
+        - otherwise -> every note with the smallest day difference (original order)
+        Returns: list of (index, days_diff, position) - index into the flat arrays
+        """
+        start, end = self.patient_slice(pat_mrn)
+        if start == end:
+            return []
+
+        # Window [exam - max_days, exam + max_days + 1) in ns reproduces `.dt.days.abs() <= max_days`
+        exam_ns = pd.Timestamp(exam_date).value
+        patient_ns = self.note_ns[start:end]
+        lo = start + np.searchsorted(patient_ns, exam_ns - max_days * NS_PER_DAY, side='left')
+        hi = start + np.searchsorted(patient_ns, exam_ns + (max_days + 1) * NS_PER_DAY, side='left')
+        if lo == hi:
+            return []
+
+        # Notes before the exam: [lo, same_day), same day: [same_day, after), after: [after, hi)
+        same_day = start + np.searchsorted(patient_ns, exam_ns, side='left')
+        after = start + np.searchsorted(patient_ns, exam_ns + NS_PER_DAY, side='left')
+        same_day, after = min(max(same_day, lo), hi), min(max(after, lo), hi)
+
+        def days_diff(i):
+            return int((self.note_ns[i] - exam_ns) // NS_PER_DAY)
+
+        def day_notes(days):
+            """Indices of the notes `days` days from the exam, in original order"""
+            day_lo = start + np.searchsorted(patient_ns, exam_ns + days * NS_PER_DAY, side='left')
+            day_hi = start + np.searchsorted(patient_ns, exam_ns + (days + 1) * NS_PER_DAY, side='left')
+            notes = np.arange(day_lo, day_hi)
+            return notes[np.argsort(self.positions[notes], kind='stable')]
+
+        if same_day > lo and hi > after:
+            before_days, after_days = days_diff(same_day - 1), days_diff(after)
+            return [
+                (day_notes(before_days)[0], before_days, 'before'),
+                (day_notes(after_days)[0], after_days, 'after')
+            ]
+
+        # Closest day: same day, else the first after, else the last before
+        anchor = same_day if after > same_day else (after if hi > after else same_day - 1)
+        closest_days = days_diff(anchor)
+        ties = day_notes(closest_days)
+
+        label = 'before' if closest_days < 0 else 'after' if closest_days > 0 else 'same_day'
+        return [(i, closest_days, label) for i in ties]
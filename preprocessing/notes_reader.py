@@ -0,0 +1,103 @@
+"""
+Streaming reader for the EHR notes parquet
+
+The notes file is far larger than memory once `note_text` is loaded, so it is
+never read whole. The Progress Notes filter is pushed down into the parquet
+scan, only the requested columns are decoded, and rows arrive in record
+batches that are normalized one at a time. `note_text` is only streamed
+into the note text store (preprocessing/note_store.py), which the app reads.
+
+Kept free of streamlit imports so both the app and the preprocessing script
+can use it.
+"""
+
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+
+NOTE_TYPE = 'Progress Notes'
+
+# Columns needed to match notes to images (no note_text)
+NOTE_INDEX_COLUMNS = ['note_id', 'pat_mrn', 'note_date']
+
+BATCH_SIZE = 256 * 1024
+
+
+def notes_filter(dataset, extra_filter=None):
+    """Progress Notes filter (when ip_note_type exists), combined with extra_filter"""
+    note_filter = None
+    if 'ip_note_type' in dataset.schema.names:
+        note_filter = ds.field('ip_note_type') == NOTE_TYPE
+    if extra_filter is not None:
+        note_filter = extra_filter if note_filter is None else note_filter & extra_filter
+    return note_filter
+
+
+def scan_notes(path, columns=NOTE_INDEX_COLUMNS, extra_filter=None, batch_size=BATCH_SIZE):
+    """Yield record batches of Progress Notes with only the requested columns"""
+    dataset = ds.dataset(path, format='parquet')
+    columns = [col for col in columns if col in dataset.schema.names]
+    scanner = dataset.scanner(
+        columns=columns,
+        filter=notes_filter(dataset, extra_filter),
+        batch_size=batch_size
+    )
+    for batch in scanner.to_batches():
+        if batch.num_rows:
+            yield batch
+
+
+def normalize_notes(notes_df):
+    """Same normalization the loaders always applied (datetime note_date, stripped string pat_mrn)"""
+    if 'note_date' in notes_df.columns:
+        notes_df['note_date'] = pd.to_datetime(notes_df['note_date'])
+    if 'pat_mrn' in notes_df.columns:
+        notes_df['pat_mrn'] = notes_df['pat_mrn'].astype(str).str.strip()
+    return notes_df
+
+
+def normalize_note_ids(note_ids):
+    """
+    note_id as the note text store keys it: integer ids as nullable Int64, also when
+    missing ids made pandas read the column as float (123.0 -> 123)
+    """
+    if pd.api.types.is_integer_dtype(note_ids):
+        return note_ids.astype('Int64')
+    if pd.api.types.is_float_dtype(note_ids):
+        valid = note_ids.dropna()
+        if (valid == np.floor(valid)).all():
+            return note_ids.astype('Int64')
+    return note_ids
+
+
+def _hash_note_text(notes_df):
+    """Replace note_text by a 64-bit hash of it (note_text_hash), so edited texts can be detected"""
+    if 'note_text' in notes_df.columns:
+        texts = notes_df.pop('note_text')
+        notes_df['note_text_hash'] = pd.util.hash_pandas_object(texts, index=False).to_numpy()
+    return notes_df
+
+
+def read_notes(path, columns=NOTE_INDEX_COLUMNS, extra_filter=None, text_hash=False):
+    """
+    Read Progress Notes batch by batch into one DataFrame
+    Peak memory is the selected columns plus a single batch
+    text_hash: also add note_text_hash (the text itself is hashed per batch and not kept)
+    """
+    scan_columns = columns + ['note_text'] if text_hash else columns
+    frames = [
+        normalize_notes(_hash_note_text(batch.to_pandas()) if text_hash else batch.to_pandas())
+        for batch in scan_notes(path, scan_columns, extra_filter)
+    ]
+    if not frames:
+        schema = ds.dataset(path, format='parquet').schema
+        empty = schema.empty_table().select([col for col in scan_columns if col in schema.names])
+        empty_df = empty.to_pandas()
+        return normalize_notes(_hash_note_text(empty_df) if text_hash else empty_df)
+    return pd.concat(frames, ignore_index=True)
+
+
+def count_notes(path):
+    """(Progress Notes, all notes) row counts - only the ip_note_type column is scanned"""
+    dataset = ds.dataset(path, format='parquet')
+    return dataset.count_rows(filter=notes_filter(dataset)), dataset.count_rows()
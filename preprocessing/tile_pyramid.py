@@ -0,0 +1,158 @@
+"""
+Deep-zoom style tile pyramid for full-resolution inspection of one image
+
+Level 0 is the upright original; each next level halves the size, down to
+the level that fits in a single tile. Levels are cut lazily, the first time
+a view needs them, and kept on disk:
+
+    <tile dir>/<sha1 of path|size|mtime>/<level>/<col>_<row>.jpg
+    <tile dir>/<sha1 of path|size|mtime>/<level>/complete
+
+A view only reads the tiles that intersect it, so zooming into a 20 MP
+photo never sends more than one viewport-size image to the browser.
+"""
+
+import io
+import os
+import math
+import hashlib
+import threading
+from pathlib import Path
+from PIL import Image, ImageOps
+
+TILE_SIZE = 512
+TILE_QUALITY = 90
+ORIENTATION_TAG = 0x0112
+
+_level_locks = {}
+_level_locks_lock = threading.Lock()
+
+
+def _level_lock(level_dir):
+    """One lock per level directory, so a level is cut only once per process"""
+    with _level_locks_lock:
+        return _level_locks.setdefault(str(level_dir), threading.Lock())
+
+
+def _drop_level_lock(level_dir):
+    """Forget the lock of a complete level (later callers see the marker file first)"""
+    with _level_locks_lock:
+        _level_locks.pop(str(level_dir), None)
+
+
+def pyramid_name(cache_key):
+    """Directory name of the pyramid of one version of an original"""
+    return hashlib.sha1(cache_key.encode('utf-8')).hexdigest()
+
+
+class TilePyramid:
+    """Lazily built tile pyramid of one image file"""
+
+    def __init__(self, source_path, tile_dir, cache_key, tile_size=TILE_SIZE):
+        """
+        source_path: file to decode (e.g. the local copy of the original)
+        cache_key: identifies this version of the original (path, size, mtime)
+        """
+        self.source_path = source_path
+        self.tile_size = tile_size
+        self.name = pyramid_name(cache_key)
+        self.root = Path(tile_dir) / self.name
+        self.bytes_written = 0
+        self._lock = threading.Lock()
+
+        with Image.open(source_path) as image:
+            width, height = image.size
+            self.rotated = image.getexif().get(ORIENTATION_TAG) in (5, 6, 7, 8)
+        self.size = (height, width) if self.rotated else (width, height)
+        self.levels = max(1, math.ceil(math.log2(max(self.size) / tile_size)) + 1)
+
+    def level_size(self, level):
+        """(width, height) of a level"""
+        factor = 2 ** level
+        return math.ceil(self.size[0] / factor), math.ceil(self.size[1] / factor)
+
+    def _tile_path(self, level, col, row):
+        return self.root / str(level) / f"{col}_{row}.jpg"
+
+    def ensure_level(self, level):
+        """Cut all tiles of a level unless they already exist (bytes_written counts the new tiles)"""
+        level_dir = self.root / str(level)
+        if (level_dir / 'complete').exists():
+            return
+
+        with _level_lock(level_dir):
+            if not (level_dir / 'complete').exists():
+                self._cut_level(level, level_dir)
+        _drop_level_lock(level_dir)
+
+    def _cut_level(self, level, level_dir):
+        level_dir.mkdir(parents=True, exist_ok=True)
+
+        width, height = self.level_size(level)
+        written = 0
+        with Image.open(self.source_path) as image:
+            if level > 0:
+                # JPEG: decode at reduced size (draft works in stored orientation)
+                image.draft('RGB', (height, width) if self.rotated else (width, height))
+            image = ImageOps.exif_transpose(image)
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            if image.size != (width, height):
+                image = image.resize((width, height), Image.LANCZOS)
+
+            size = self.tile_size
+            for col in range(math.ceil(width / size)):
+                for row in range(math.ceil(height / size)):
+                    tile = image.crop((col * size, row * size, min((col + 1) * size, width), min((row + 1) * size, height)))
+                    tmp_path = level_dir / f"{col}_{row}.jpg.tmp"
+                    tile.save(tmp_path, format='JPEG', quality=TILE_QUALITY)
+                    written += tmp_path.stat().st_size
+                    os.replace(tmp_path, self._tile_path(level, col, row))
+
+        (level_dir / 'complete').touch()
+        with self._lock:
+            self.bytes_written += written
+
+    def render_view(self, zoom, center_x, center_y, view_width, image_format='JPEG', quality=85):
+        """
+        Encoded view of the image at `zoom` (1 = whole image at view_width)
+        center_x / center_y: view center as a fraction (0-1) of width / height
+        Returns: (bytes, (x0, y0, x1, y1) visible region as fractions)
+        """
+        width, height = self.size
+        view_height = max(1, round(view_width * height / width))
+        region_width, region_height = width / zoom, height / zoom
+        x0 = min(max(center_x * width - region_width / 2, 0), width - region_width)
+        y0 = min(max(center_y * height - region_height / 2, 0), height - region_height)
+
+        # Coarsest level that still has at least one pixel per output pixel
+        scale = view_width / region_width
+        level = 0 if scale >= 1 else min(int(math.floor(math.log2(1 / scale))), self.levels - 1)
+        self.ensure_level(level)
+
+        factor = 2 ** level
+        level_width, level_height = self.level_size(level)
+        left, top = x0 / factor, y0 / factor
+        right, bottom = min((x0 + region_width) / factor, level_width), min((y0 + region_height) / factor, level_height)
+
+        # Only the tiles intersecting the region are read
+        size = self.tile_size
+        first_col, first_row = int(left // size), int(top // size)
+        last_col, last_row = int(math.ceil(right / size)) - 1, int(math.ceil(bottom / size)) - 1
+        canvas = Image.new('RGB', ((last_col - first_col + 1) * size, (last_row - first_row + 1) * size))
+        for col in range(first_col, last_col + 1):
+            for row in range(first_row, last_row + 1):
+                with Image.open(self._tile_path(level, col, row)) as tile:
+                    canvas.paste(tile, ((col - first_col) * size, (row - first_row) * size))
+
+        offset_x, offset_y = first_col * size, first_row * size
+        view = canvas.resize(
+            (view_width, view_height),
+            Image.LANCZOS,
+            box=(left - offset_x, top - offset_y, right - offset_x, bottom - offset_y)
+        )
+
+        buffer = io.BytesIO()
+        view.save(buffer, format=image_format, quality=quality)
+        region = (x0 / width, y0 / height, (x0 + region_width) / width, (y0 + region_height) / height)
+        return buffer.getvalue(), region
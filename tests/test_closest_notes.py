@@ -0,0 +1,55 @@
+"""
+Closest-note rule with several notes on the same day
+
+DataLoader.get_closest_notes (the original groupby rule) keeps, within the
+closest day before and the closest day after the exam, the note that comes
+first in source order.
+"""
+
+import numpy as np
+import pandas as pd
+from preprocessing.matching import resolve_notes
+from preprocessing.notes_index import NotesIndex, build_notes_index, write_notes_index
+
+EXAM = pd.Timestamp('2021-03-10')
+
+# Two notes on each side of the exam, each pair on one day; the later source row sorts first by time
+NOTES = pd.DataFrame({
+    'pat_mrn': ['A', 'A', 'A', 'A', 'A'],
+    'note_date': pd.to_datetime([
+        '2021-03-08 15:00',  # 0: closest day before, first in source order
+        '2021-03-08 09:00',  # 1: closest day before
+        '2021-03-12 16:00',  # 2: closest day after, first in source order
+        '2021-03-12 08:00',  # 3: closest day after
+        '2021-03-01 12:00',  # 4: further before
+    ]),
+    'note_id': [10, 11, 12, 13, 14]
+})
+
+
+def test_resolve_notes_between_same_day_notes():
+    count, first, second = resolve_notes(
+        np.array(['A']), pd.Series([EXAM]), NOTES['pat_mrn'].to_numpy(), NOTES['note_date'], 30
+    )
+    assert count.tolist() == [5]
+    assert (first[0], second[0]) == (0, 2)
+
+
+def test_resolve_notes_between_date_only_notes():
+    notes = NOTES.assign(note_date=NOTES['note_date'].dt.normalize())
+    _, first, second = resolve_notes(
+        np.array(['A']), pd.Series([EXAM]), notes['pat_mrn'].to_numpy(), notes['note_date'], 30
+    )
+    assert (first[0], second[0]) == (0, 2)
+
+
+def test_notes_index_between_same_day_notes(tmp_path):
+    path = tmp_path / 'notes_index.npz'
+    write_notes_index(build_notes_index(NOTES), path)
+    index = NotesIndex(path)
+
+    closest = index.closest_notes('A', EXAM, 30)
+    assert [(int(index.positions[i]), days_diff, position) for i, days_diff, position in closest] == [
+        (0, -2, 'before'),
+        (2, 2, 'after')
+    ]
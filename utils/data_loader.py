@@ -7,6 +7,7 @@ import numpy as np
 from pathlib import Path
 from datetime import datetime, timedelta
 from functools import lru_cache
+import threading
 import streamlit as st
 from config.config import (
     DIAGNOSIS_PATH,
@@ -18,8 +19,82 @@ from config.config import (
     MAX_ANNOTATION_DAYS_DIFFERENCE,
     DEFAULT_DATASET_FILTER,
     PREPROCESSED_PATH,
-    USE_PREPROCESSED
+    PREPROCESSED_ANNOTATIONS_PATH,
+    PREPROCESSED_NOTES_PATH,
+    NOTE_STORE_PATH,
+    NOTES_INDEX_PATH,
+    ANNOTATIONS_INDEX_PATH,
+    PREPROCESSED_METADATA_KEY,
+    USE_PREPROCESSED,
+    EXAM_MEMO_SIZE
 )
+from preprocessing.notes_reader import (
+    NOTE_INDEX_COLUMNS,
+    read_notes,
+    count_notes
+)
+from preprocessing.note_store import NoteTextStore, note_store_index_path
+from preprocessing.notes_index import NotesIndex
+from preprocessing.annotations_index import AnnotationsIndex
+from utils.exam_memo import ExamMemo
+from preprocessing.dataset_io import FILTER_MODE_PARTITIONS, read_dataset, read_build_info, count_rows, metadata_path
+
+def read_preprocessing_metadata(path):
+    """Read the preprocessing parameters stored in a parquet file's (or dataset's) schema metadata"""
+    return read_build_info(path, PREPROCESSED_METADATA_KEY)
+
+def file_signature(path):
+    """(path, size, mtime) - cache key that changes whenever the file is replaced"""
+    stat = Path(path).stat()
+    return str(path), stat.st_size, stat.st_mtime_ns
+
+# Cached source readers: one parsed, normalized copy per file version and process.
+# cache_resource returns the same objects to every caller - never modify them in place.
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def read_diagnosis_source(signature):
+    """Diagnosis data (Stata file) with datetime exam_date and string pat_mrn"""
+    diagnosis_df = pd.read_stata(signature[0])
+    diagnosis_df['exam_date'] = pd.to_datetime(diagnosis_df['exam_date'])
+    
+    # Convert pat_mrn to string for consistent matching
+    if 'pat_mrn' in diagnosis_df.columns:
+        diagnosis_df['pat_mrn'] = diagnosis_df['pat_mrn'].astype(str).str.strip()
+    return diagnosis_df
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def read_notes_source(signature):
+    """Progress Notes (without note_text), streamed with the note type filter pushed down"""
+    notes_df = read_notes(signature[0], NOTE_INDEX_COLUMNS)
+    progress_count, original_count = count_notes(signature[0])
+    print(f"Filtered to Progress Notes: {progress_count:,} / {original_count:,}")
+    return notes_df
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def read_crosswalk_source(signature):
+    """Crosswalk data (CSV file) with string maskedid"""
+    cross_df = pd.read_csv(signature[0])
+    
+    # Convert maskedid to string for consistent matching
+    if 'maskedid' in cross_df.columns:
+        cross_df['maskedid'] = cross_df['maskedid'].astype(str).str.strip()
+    return cross_df
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def read_annotations_source(signature):
+    """Annotations data (CSV file) with maskedid and annotation_date columns"""
+    annotations_df = pd.read_csv(signature[0])
+    
+    # Rename studyid to maskedid in annotations
+    if 'studyid' in annotations_df.columns:
+        annotations_df.rename(columns={'studyid': 'maskedid'}, inplace=True)
+    if 'date' in annotations_df.columns:
+        annotations_df['annotation_date'] = pd.to_datetime(annotations_df['date'])
+    
+    # Convert maskedid to string for consistent matching
+    if 'maskedid' in annotations_df.columns:
+        annotations_df['maskedid'] = annotations_df['maskedid'].astype(str).str.strip()
+    return annotations_df
 
 class DataLoader:
     """Class to handle loading and merging of all datasets"""
@@ -37,52 +112,52 @@ class DataLoader:
         self._annotations_indexed = None
         self._notes_loaded = False
         self._annotations_loaded = False
+        self._missing_note_texts_reported = False
         
-    @st.cache_data
-    def load_data(_self):
-        """Load all datasets with caching"""
+        # Per-patient CSR notes index (from preprocessing)
+        self._notes_index = None
+        self._notes_index_loaded = False
+        
+        # Per-visit annotations index (from preprocessing)
+        self._annotations_index = None
+        self._annotations_index_loaded = False
+        
+        # Memory-mapped note text store (from preprocessing)
+        self._note_store = None
+        self._note_store_opened = False
+        
+        # Closest notes/annotations per exam, reused by every photo of the exam
+        self._notes_memo = ExamMemo(EXAM_MEMO_SIZE)
+        self._annotations_memo = ExamMemo(EXAM_MEMO_SIZE)
+        
+        # Lazy loads may run from several sessions at once (shared loader)
+        self._lock = threading.RLock()
+        
+        # Notes referenced by the precomputed closest-note pointers (from preprocessing)
+        self._note_context = None
+        self._note_context_loaded = False
+        
+        # Precomputed closest annotations per exam (from preprocessing)
+        self._annotation_context = None
+        self._annotation_context_loaded = False
+        
+    def load_data(self):
+        """
+        Load all datasets - each source is parsed once per process by the
+        cached readers (keyed on path + size + mtime), then shared read-only
+        """
         try:
             # Load diagnosis data (Stata file)
-            _self.diagnosis_df = pd.read_stata(DIAGNOSIS_PATH)
+            self.diagnosis_df = read_diagnosis_source(file_signature(DIAGNOSIS_PATH))
             
-            # Load notes data (Parquet file)
-            _self.notes_df = pd.read_parquet(NOTES_PATH)
+            # Load notes data (Parquet file) - streamed, Progress Notes only, no note_text
+            self.notes_df = read_notes_source(file_signature(NOTES_PATH))
             
             # Load crosswalk data (CSV file)
-            _self.cross_df = pd.read_csv(CROSS_PATH)
+            self.cross_df = read_crosswalk_source(file_signature(CROSS_PATH))
             
             # Load annotations data (CSV file)
-            _self.annotations_df = pd.read_csv(ANNOTATIONS_PATH)
-            
-            # Rename studyid to maskedid in annotations
-            if 'studyid' in _self.annotations_df.columns:
-                _self.annotations_df.rename(columns={'studyid': 'maskedid'}, inplace=True)
-            
-            # Convert date columns to datetime
-            _self.diagnosis_df['exam_date'] = pd.to_datetime(_self.diagnosis_df['exam_date'])
-            _self.notes_df['note_date'] = pd.to_datetime(_self.notes_df['note_date'])
-            
-            # Convert annotation date column to datetime
-            if 'date' in _self.annotations_df.columns:
-                _self.annotations_df['annotation_date'] = pd.to_datetime(_self.annotations_df['date'])
-            
-            # Convert pat_mrn to string for consistent matching
-            if 'pat_mrn' in _self.diagnosis_df.columns:
-                _self.diagnosis_df['pat_mrn'] = _self.diagnosis_df['pat_mrn'].astype(str).str.strip()
-            if 'pat_mrn' in _self.notes_df.columns:
-                _self.notes_df['pat_mrn'] = _self.notes_df['pat_mrn'].astype(str).str.strip()
-            
-            # Filter for Progress Notes only
-            if 'ip_note_type' in _self.notes_df.columns:
-                original_count = len(_self.notes_df)
-                _self.notes_df = _self.notes_df[_self.notes_df['ip_note_type'] == 'Progress Notes'].copy()
-                print(f"Filtered to Progress Notes: {len(_self.notes_df):,} / {original_count:,}")
-            
-            # Convert maskedid to string for consistent matching
-            if 'maskedid' in _self.annotations_df.columns:
-                _self.annotations_df['maskedid'] = _self.annotations_df['maskedid'].astype(str).str.strip()
-            if 'maskedid' in _self.cross_df.columns:
-                _self.cross_df['maskedid'] = _self.cross_df['maskedid'].astype(str).str.strip()
+            self.annotations_df = read_annotations_source(file_signature(ANNOTATIONS_PATH))
             
             return True, "Data loaded successfully"
         except Exception as e:
@@ -100,25 +175,31 @@ class DataLoader:
             print(f"  File exists: {Path(PREPROCESSED_PATH).exists()}")
         print("=" * 60)
         
+        # Note texts are only read from the note text store - never by rescanning the notes parquet,
+        # so without the store images are labeled with notes shown without their text
+        if not NOTE_STORE_PATH or not Path(note_store_index_path(NOTE_STORE_PATH)).exists():
+            print(f"⚠️  Note text store not found ({NOTE_STORE_PATH or 'NOTE_STORE_PATH is not set'}) - "
+                  "loading without note texts. Run preprocessing/create_preprocessed_dataset.py to build it.")
+        
         # Try to load preprocessed dataset if enabled
         if USE_PREPROCESSED and PREPROCESSED_PATH and Path(PREPROCESSED_PATH).exists():
             try:
                 print(f"✅ Loading preprocessed dataset from {PREPROCESSED_PATH}...")
-                self.merged_df = pd.read_parquet(PREPROCESSED_PATH)
-                print(f"   Loaded {len(self.merged_df):,} rows")
+                original_count = count_rows(PREPROCESSED_PATH)
+                self.merged_df = read_dataset(PREPROCESSED_PATH, self._filter_partitions())
+                print(f"   Loaded {len(self.merged_df):,} / {original_count:,} rows")
                 
                 # Convert pat_mrn and maskedid to string in merged_df for consistent matching
-                if 'pat_mrn' in self.merged_df.columns:
-                    self.merged_df['pat_mrn'] = self.merged_df['pat_mrn'].astype(str).str.strip()
-                if 'maskedid' in self.merged_df.columns:
-                    self.merged_df['maskedid'] = self.merged_df['maskedid'].astype(str).str.strip()
+                # (categorical columns were already normalized by preprocessing)
+                for col in ('pat_mrn', 'maskedid'):
+                    if col in self.merged_df.columns and not isinstance(self.merged_df[col].dtype, pd.CategoricalDtype):
+                        self.merged_df[col] = self.merged_df[col].astype(str).str.strip()
                 
                 # DON'T load notes/annotations yet - use lazy loading!
                 # They will be loaded only when actually needed
                 print("   Using lazy loading for notes and annotations (faster!)")
                 
                 # Apply filter
-                original_count = len(self.merged_df)
                 print(f"   Applying filter: {self.filter_mode}")
                 self.merged_df = self._apply_dataset_filter_fast(self.merged_df)
                 filtered_count = len(self.merged_df)
@@ -174,8 +255,31 @@ class DataLoader:
         except Exception as e:
             return False, f"Error merging datasets: {str(e)}"
     
+    def _filter_partitions(self):
+        """
+        Partitions to read for the current filter mode - only valid when the
+        flags were built with the configured windows, otherwise read everything
+        """
+        build_info = read_preprocessing_metadata(PREPROCESSED_PATH)
+        if (build_info.get('max_note_days_difference') != MAX_NOTE_DAYS_DIFFERENCE or
+                build_info.get('max_annotation_days_difference') != MAX_ANNOTATION_DAYS_DIFFERENCE):
+            return {}
+        return FILTER_MODE_PARTITIONS.get(self.filter_mode, {})
+    
+    def _apply_configured_windows(self, df):
+        """
+        Re-derive has_notes/has_annotations for the configured day windows from the
+        nearest-distance columns, so a changed window never needs a rebuild
+        """
+        if 'note_nearest_days' in df.columns:
+            df['has_notes'] = df['note_nearest_days'].le(MAX_NOTE_DAYS_DIFFERENCE).fillna(False).astype(bool)
+        if 'annotation_nearest_days' in df.columns:
+            df['has_annotations'] = df['annotation_nearest_days'].le(MAX_ANNOTATION_DAYS_DIFFERENCE).fillna(False).astype(bool)
+        return df
+    
     def _apply_dataset_filter_fast(self, df):
         """Apply dataset filter using pre-calculated flags (FAST)"""
+        df = self._apply_configured_windows(df)
         if self.filter_mode == "ALL":
             return df
         
@@ -191,48 +295,144 @@ class DataLoader:
     
     def _ensure_notes_loaded(self):
         """Lazy load notes data only when needed"""
-        if not self._notes_loaded:
-            try:
-                print("   📝 Loading notes for first time (lazy loading)...")
-                self.notes_df = pd.read_parquet(NOTES_PATH)
-                self.notes_df['note_date'] = pd.to_datetime(self.notes_df['note_date'])
-                
-                # Convert pat_mrn to string and filter Progress Notes
-                if 'pat_mrn' in self.notes_df.columns:
-                    self.notes_df['pat_mrn'] = self.notes_df['pat_mrn'].astype(str).str.strip()
-                if 'ip_note_type' in self.notes_df.columns:
-                    self.notes_df = self.notes_df[self.notes_df['ip_note_type'] == 'Progress Notes'].copy()
-                
-                # Create indexed version for fast lookups
-                self._notes_indexed = self.notes_df.groupby('pat_mrn')
-                self._notes_loaded = True
-                print(f"   ✅ Notes loaded and indexed ({len(self.notes_df):,} Progress Notes)")
-            except Exception as e:
-                print(f"   ⚠️  Could not load notes: {e}")
-                self._notes_loaded = True  # Don't try again
+        with self._lock:
+            if not self._notes_loaded:
+                try:
+                    print("   📝 Loading notes for first time (lazy loading)...")
+                    # Streamed in batches: Progress Notes only, without note_text
+                    # (text comes from the note text store, see _get_note_texts)
+                    self.notes_df = read_notes_source(file_signature(NOTES_PATH))
+                    
+                    # Create indexed version for fast lookups
+                    self._notes_indexed = self.notes_df.groupby('pat_mrn')
+                    self._notes_loaded = True
+                    print(f"   ✅ Notes loaded and indexed ({len(self.notes_df):,} Progress Notes)")
+                except Exception as e:
+                    print(f"   ⚠️  Could not load notes: {e}")
+                    self._notes_loaded = True  # Don't try again
     
     def _ensure_annotations_loaded(self):
         """Lazy load annotations data only when needed"""
-        if not self._annotations_loaded:
-            try:
-                print("   🔬 Loading annotations for first time (lazy loading)...")
-                self.annotations_df = pd.read_csv(ANNOTATIONS_PATH)
-                if 'studyid' in self.annotations_df.columns:
-                    self.annotations_df.rename(columns={'studyid': 'maskedid'}, inplace=True)
-                if 'date' in self.annotations_df.columns:
-                    self.annotations_df['annotation_date'] = pd.to_datetime(self.annotations_df['date'])
-                
-                # Convert maskedid to string
-                if 'maskedid' in self.annotations_df.columns:
-                    self.annotations_df['maskedid'] = self.annotations_df['maskedid'].astype(str).str.strip()
-                
-                # Create indexed version for fast lookups
-                self._annotations_indexed = self.annotations_df.groupby('maskedid')
-                self._annotations_loaded = True
-                print(f"   ✅ Annotations loaded and indexed ({len(self.annotations_df):,} records)")
-            except Exception as e:
-                print(f"   ⚠️  Could not load annotations: {e}")
-                self._annotations_loaded = True  # Don't try again
+        with self._lock:
+            if not self._annotations_loaded:
+                try:
+                    print("   🔬 Loading annotations for first time (lazy loading)...")
+                    self.annotations_df = read_annotations_source(file_signature(ANNOTATIONS_PATH))
+                    
+                    # Create indexed version for fast lookups
+                    self._annotations_indexed = self.annotations_df.groupby('maskedid')
+                    self._annotations_loaded = True
+                    print(f"   ✅ Annotations loaded and indexed ({len(self.annotations_df):,} records)")
+                except Exception as e:
+                    print(f"   ⚠️  Could not load annotations: {e}")
+                    self._annotations_loaded = True  # Don't try again
+    
+    def _ensure_note_context_loaded(self):
+        """Lazy load the notes referenced by the precomputed closest-note pointers"""
+        with self._lock:
+            if not self._note_context_loaded:
+                self._note_context_loaded = True  # Don't try again
+                if not PREPROCESSED_NOTES_PATH or not Path(PREPROCESSED_NOTES_PATH).exists():
+                    return
+                try:
+                    build_info = read_preprocessing_metadata(PREPROCESSED_NOTES_PATH)
+                    if build_info.get('max_note_days_difference') != MAX_NOTE_DAYS_DIFFERENCE:
+                        print("   ⚠️  Note context was built with a different window - using notes parquet")
+                        return
+                    
+                    context_df = pd.read_parquet(PREPROCESSED_NOTES_PATH)
+                    self._note_context = dict(zip(context_df['note_id'].tolist(), context_df['note_date']))
+                    print(f"   ✅ Note context loaded ({len(context_df):,} notes)")
+                except Exception as e:
+                    print(f"   ⚠️  Could not load note context: {e}")
+                    self._note_context = None
+    
+    def get_precomputed_notes(self, row):
+        """
+        Get the closest note(s) for an image from its precomputed pointers
+        Returns: list of dicts (same format as get_closest_notes), or None if
+        the note context table is not available
+        """
+        self._ensure_note_context_loaded()
+        
+        if self._note_context is None:
+            return None
+        
+        result = []
+        for suffix in ('1', '2'):
+            note_id = row.get(f'note_id_{suffix}')
+            if pd.isna(note_id) or note_id not in self._note_context:
+                continue
+            
+            result.append({
+                'note_id': note_id,
+                'note_date': self._note_context[note_id],
+                'note_text': None,
+                'days_diff': int(row[f'note_days_diff_{suffix}']),
+                'position': row[f'note_position_{suffix}']
+            })
+        
+        texts = self._get_note_texts([note['note_id'] for note in result])
+        for note, note_text in zip(result, texts):
+            note['note_text'] = note_text
+        
+        return result
+    
+    def _ensure_annotation_context_loaded(self):
+        """Lazy load the precomputed annotation context table (replaces ANNOTATIONS_PATH)"""
+        with self._lock:
+            if not self._annotation_context_loaded:
+                self._annotation_context_loaded = True  # Don't try again
+                if not PREPROCESSED_ANNOTATIONS_PATH or not Path(PREPROCESSED_ANNOTATIONS_PATH).exists():
+                    return
+                try:
+                    build_info = read_preprocessing_metadata(PREPROCESSED_ANNOTATIONS_PATH)
+                    if build_info.get('max_annotation_days_difference') != MAX_ANNOTATION_DAYS_DIFFERENCE:
+                        print("   ⚠️  Annotation context was built with a different window - using annotations CSV")
+                        return
+                    
+                    context_df = pd.read_parquet(PREPROCESSED_ANNOTATIONS_PATH)
+                    
+                    # Preprocessing writes the table sorted by annotation_ctx
+                    self._annotation_context = {
+                        'keys': context_df['annotation_ctx'].to_numpy(),
+                        'examfield': context_df['examfield'].tolist(),
+                        'value': context_df['value'].tolist(),
+                        'annotation_date': list(context_df['annotation_date']),
+                        'days_diff': context_df['days_diff'].tolist(),
+                        'laterality': context_df['laterality'].tolist()
+                    }
+                    print(f"   ✅ Annotation context loaded ({len(context_df):,} records)")
+                except Exception as e:
+                    print(f"   ⚠️  Could not load annotation context: {e}")
+                    self._annotation_context = None
+    
+    def get_precomputed_annotations(self, annotation_ctx):
+        """
+        Get the closest annotations for an exam context with one keyed lookup
+        Returns: list of dicts (same format as get_annotations), or None if
+        the annotation context table is not available
+        """
+        self._ensure_annotation_context_loaded()
+        
+        if self._annotation_context is None:
+            return None
+        
+        context = self._annotation_context
+        keys = context['keys']
+        start = np.searchsorted(keys, annotation_ctx, side='left')
+        end = np.searchsorted(keys, annotation_ctx, side='right')
+        
+        return [
+            {
+                'examfield': context['examfield'][i],
+                'value': context['value'][i],
+                'annotation_date': context['annotation_date'][i],
+                'days_diff': context['days_diff'][i],
+                'laterality': context['laterality'][i]
+            }
+            for i in range(start, end)
+        ]
     
     def _apply_dataset_filter(self, df):
         """Apply dataset filter based on configuration"""
@@ -247,7 +447,7 @@ class DataLoader:
         for idx, row in df.iterrows():
             # Check for notes
             if pd.notna(row.get('pat_mrn')) and pd.notna(row.get('exam_date')):
-                notes = self.get_closest_notes(row['pat_mrn'], row['exam_date'])
+                notes = self.get_closest_notes(row['pat_mrn'], row['exam_date'], with_text=False)
                 if notes:
                     df.at[idx, 'has_notes'] = True
             
@@ -270,11 +470,95 @@ class DataLoader:
         
         return df.reset_index(drop=True)
     
-    def get_closest_notes(self, pat_mrn, exam_date):
+    def _ensure_notes_index_loaded(self):
+        """Lazy load the CSR notes index (replaces the notes groupby)"""
+        with self._lock:
+            if not self._notes_index_loaded:
+                self._notes_index_loaded = True  # Don't try again
+                if not NOTES_INDEX_PATH or not Path(NOTES_INDEX_PATH).exists():
+                    return
+                try:
+                    self._notes_index = NotesIndex(NOTES_INDEX_PATH)
+                    print(f"   ✅ Notes index loaded ({len(self._notes_index):,} Progress Notes)")
+                except Exception as e:
+                    print(f"   ⚠️  Could not load notes index: {e}")
+                    self._notes_index = None
+    
+    def _closest_notes_from_index(self, pat_mrn, exam_date, with_text=True):
+        """get_closest_notes through the CSR index - binary searches, no DataFrame work"""
+        index = self._notes_index
+        result = [
+            {
+                'note_id': index.note_ids[i],
+                'note_date': pd.Timestamp(index.note_dates[i]),
+                'note_text': None,
+                'days_diff': days_diff,
+                'position': position
+            }
+            for i, days_diff, position in index.closest_notes(pat_mrn, exam_date, MAX_NOTE_DAYS_DIFFERENCE)
+        ]
+        
+        if with_text:
+            texts = self._get_note_texts([note['note_id'] for note in result])
+            for note, note_text in zip(result, texts):
+                note['note_text'] = note_text
+        
+        return result
+    
+    def _ensure_annotations_index_loaded(self):
+        """Lazy load the per-visit annotations index (replaces the annotations groupby)"""
+        with self._lock:
+            if not self._annotations_index_loaded:
+                self._annotations_index_loaded = True  # Don't try again
+                if not ANNOTATIONS_INDEX_PATH or not Path(ANNOTATIONS_INDEX_PATH).exists():
+                    return
+                try:
+                    self._annotations_index = AnnotationsIndex(ANNOTATIONS_INDEX_PATH)
+                    print(f"   ✅ Annotations index loaded ({len(self._annotations_index):,} annotations)")
+                except Exception as e:
+                    print(f"   ⚠️  Could not load annotations index: {e}")
+                    self._annotations_index = None
+    
+    def _ensure_note_store_opened(self):
+        """Lazy open the memory-mapped note text store"""
+        with self._lock:
+            if not self._note_store_opened:
+                self._note_store_opened = True  # Don't try again
+                if not NOTE_STORE_PATH or not Path(note_store_index_path(NOTE_STORE_PATH)).exists():
+                    return
+                try:
+                    self._note_store = NoteTextStore(NOTE_STORE_PATH)
+                    print(f"   ✅ Note text store opened ({len(self._note_store):,} notes)")
+                except Exception as e:
+                    print(f"   ⚠️  Could not open note text store: {e}")
+                    self._note_store = None
+    
+    def _get_note_texts(self, note_ids):
+        """
+        Read note_text for the given notes only, from the memory-mapped note text store
+        (None for notes the store does not have)
+        """
+        self._ensure_note_store_opened()
+        if self._note_store is None:
+            return [None] * len(note_ids)
+        
+        if not self._missing_note_texts_reported and not all(note_id in self._note_store for note_id in note_ids):
+            self._missing_note_texts_reported = True
+            print("   ⚠️  Some notes are missing from the note text store - "
+                  "rerun preprocessing/create_preprocessed_dataset.py to update it")
+        return [self._note_store.get(note_id) for note_id in note_ids]
+    
+    def get_closest_notes(self, pat_mrn, exam_date, with_text=True):
         """
         Get the closest note(s) to the exam date
         Returns: list of dicts with note information
+        (note_text is None when with_text=False)
         """
+        # CSR index from preprocessing when available (no groupby, no per-call frames)
+        self._ensure_notes_index_loaded()
+        if self._notes_index is not None:
+            return self._closest_notes_from_index(pat_mrn, exam_date, with_text)
+        
         # Lazy load notes if needed
         self._ensure_notes_loaded()
         
@@ -317,14 +601,14 @@ class DataLoader:
             result.append({
                 'note_id': notes_before.iloc[0]['note_id'],
                 'note_date': notes_before.iloc[0]['note_date'],
-                'note_text': notes_before.iloc[0]['note_text'],
+                'note_text': None,
                 'days_diff': int(notes_before.iloc[0]['days_diff']),
                 'position': 'before'
             })
             result.append({
                 'note_id': notes_after.iloc[0]['note_id'],
                 'note_date': notes_after.iloc[0]['note_date'],
-                'note_text': notes_after.iloc[0]['note_text'],
+                'note_text': None,
                 'days_diff': int(notes_after.iloc[0]['days_diff']),
                 'position': 'after'
             })
@@ -334,11 +618,16 @@ class DataLoader:
                 result.append({
                     'note_id': note['note_id'],
                     'note_date': note['note_date'],
-                    'note_text': note['note_text'],
+                    'note_text': None,
                     'days_diff': int(note['days_diff']),
                     'position': 'before' if note['days_diff'] < 0 else 'after' if note['days_diff'] > 0 else 'same_day'
                 })
         
+        if with_text:
+            texts = self._get_note_texts([note['note_id'] for note in result])
+            for note, note_text in zip(result, texts):
+                note['note_text'] = note_text
+        
         return result
     
     def get_annotations(self, maskedid, exam_date):
@@ -346,6 +635,13 @@ class DataLoader:
         Get annotations for a specific maskedid within date range
         Returns: list of dicts with annotation information
         """
+        # Per-visit index from preprocessing: bisection over the visit dates
+        self._ensure_annotations_index_loaded()
+        if self._annotations_index is not None:
+            return self._annotations_index.closest_annotations(
+                maskedid, exam_date, MAX_ANNOTATION_DAYS_DIFFERENCE
+            )
+        
         # Lazy load annotations if needed
         self._ensure_annotations_loaded()
         
@@ -399,6 +695,42 @@ class DataLoader:
         path = Path(IMAGE_BASE_PATH) / row['maskedid'] / row['maskedid_studyid'] / row['proc_name'] / row['photo_name']
         return str(path)
     
+    def _lookup_image_notes(self, row):
+        """Closest notes for an image (precomputed pointers when available)"""
+        notes = None
+        if 'note_id_1' in row.index:
+            notes = self.get_precomputed_notes(row)
+        if notes is None:
+            notes = []
+            if pd.notna(row['pat_mrn']) and pd.notna(row['exam_date']):
+                notes = self.get_closest_notes(row['pat_mrn'], row['exam_date'])
+        return notes
+    
+    def _lookup_image_annotations(self, row):
+        """Closest annotations for an image (precomputed per exam when available)"""
+        annotations = None
+        if 'annotation_ctx' in row.index:
+            annotations = self.get_precomputed_annotations(row['annotation_ctx'])
+        if annotations is None:
+            annotations = []
+            if pd.notna(row['maskedid']) and pd.notna(row['exam_date']):
+                annotations = self.get_annotations(row['maskedid'], row['exam_date'])
+        return annotations
+    
+    @staticmethod
+    def _memoized(memo, key, lookup):
+        """Memoized lookup; keys with missing values are not cached"""
+        if any(pd.isna(part) for part in key):
+            return lookup()
+        return memo.get_or_compute(key, lookup)
+    
+    def get_memo_stats(self):
+        """Hit/miss counters of the exam-level notes and annotations memos"""
+        return {
+            'notes': self._notes_memo.stats(),
+            'annotations': self._annotations_memo.stats()
+        }
+    
     def get_image_data(self, index):
         """
         Get all data for a specific image
@@ -414,15 +746,13 @@ class DataLoader:
         
         row = self.merged_df.iloc[index]
         
-        # Get closest notes
-        notes = []
-        if pd.notna(row['pat_mrn']) and pd.notna(row['exam_date']):
-            notes = self.get_closest_notes(row['pat_mrn'], row['exam_date'])
-        
-        # Get annotations
-        annotations = []
-        if pd.notna(row['maskedid']) and pd.notna(row['exam_date']):
-            annotations = self.get_annotations(row['maskedid'], row['exam_date'])
+        # Notes and annotations are looked up once per exam, not once per photo
+        notes = self._memoized(
+            self._notes_memo, (row['pat_mrn'], row['exam_date']), lambda: self._lookup_image_notes(row)
+        )
+        annotations = self._memoized(
+            self._annotations_memo, (row['maskedid'], row['exam_date']), lambda: self._lookup_image_annotations(row)
+        )
         
         # Construct image path
         image_path = self.get_image_path(row)
@@ -479,3 +809,54 @@ class DataLoader:
             return indices
         else:
             return list(range(total_images))
+
+
+def data_source_fingerprint():
+    """
+    (path, size, mtime) of every file the DataLoader reads - changes whenever
+    preprocessing reruns or a source file is replaced
+    """
+    paths = [
+        metadata_path(PREPROCESSED_PATH) if PREPROCESSED_PATH else None,
+        PREPROCESSED_ANNOTATIONS_PATH,
+        PREPROCESSED_NOTES_PATH,
+        note_store_index_path(NOTE_STORE_PATH) if NOTE_STORE_PATH else None,
+        NOTES_INDEX_PATH,
+        ANNOTATIONS_INDEX_PATH,
+        DIAGNOSIS_PATH,
+        NOTES_PATH,
+        CROSS_PATH,
+        ANNOTATIONS_PATH
+    ]
+    return tuple(file_signature(path) for path in paths if path and Path(path).exists())
+
+# Filter mode -> (source fingerprint, DataLoader, message); one loader per mode
+_shared_loaders = {}
+_shared_loaders_lock = threading.Lock()
+_shared_loader_mode_locks = {}
+
+def get_shared_data_loader(filter_mode, fingerprint):
+    """
+    One loaded DataLoader per filter mode, shared by all sessions of this
+    process and replaced when the source fingerprint changes. Sessions must
+    treat it as read-only.
+    Returns: (data_loader, message) - raises RuntimeError if loading fails (not kept)
+    """
+    with _shared_loaders_lock:
+        mode_lock = _shared_loader_mode_locks.setdefault(filter_mode, threading.Lock())
+    
+    # Sessions asking for the same mode wait for a single load
+    with mode_lock:
+        entry = _shared_loaders.get(filter_mode)
+        if entry is not None and entry[0] == fingerprint:
+            return entry[1], entry[2]
+        
+        # Drop a stale loader before loading its replacement (never two full datasets per mode)
+        _shared_loaders.pop(filter_mode, None)
+        data_loader = DataLoader()
+        data_loader.filter_mode = filter_mode
+        success, message = data_loader.merge_datasets()
+        if not success:
+            raise RuntimeError(message)
+        _shared_loaders[filter_mode] = (fingerprint, data_loader, message)
+        return data_loader, message
@@ -0,0 +1,186 @@
+"""
+Local read-through disk cache for images on the network share
+
+Cached copies are named after the source path, size and mtime:
+
+    <sha1 of source path>_<size>_<mtime_ns><suffix>
+
+so a replaced source file never matches an old copy, and a copy whose own
+size differs from the recorded size (interrupted write) is discarded. The
+copy's mtime records its last use; the least recently used copies are
+removed once the cache grows past its size cap.
+"""
+
+import os
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import streamlit as st
+from config.config import IMAGE_CACHE_DIR, IMAGE_DISK_CACHE_GB, DISK_CACHE_WARM_WORKERS
+
+
+class DiskImageCache:
+    """Size-capped LRU copy of source images on local disk"""
+
+    def __init__(self, cache_dir, max_bytes, warm_workers=DISK_CACHE_WARM_WORKERS):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._warming = set()
+        self._executor = ThreadPoolExecutor(max_workers=warm_workers, thread_name_prefix="disk-cache-warm")
+
+        # Rebuild the LRU order from the copies' mtimes (last use); drop leftover temp files
+        entries = []
+        for path in self.cache_dir.iterdir():
+            if path.name.endswith('.tmp'):
+                path.unlink(missing_ok=True)
+                continue
+            stat = path.stat()
+            entries.append((stat.st_mtime_ns, path.name, stat.st_size))
+        self._entries = OrderedDict((name, size) for _, name, size in sorted(entries))
+        self.total_bytes = sum(self._entries.values())
+
+    @staticmethod
+    def cache_name(source_path, stat):
+        """File name of the cached copy for one version of a source file"""
+        digest = hashlib.sha1(str(source_path).encode('utf-8')).hexdigest()
+        return f"{digest}_{stat.st_size}_{stat.st_mtime_ns}{Path(source_path).suffix.lower()}"
+
+    def local_path(self, source_path):
+        """
+        Path of an up-to-date local copy of source_path, copied on a miss
+        Raises OSError if the source is missing or unreadable
+        """
+        stat = os.stat(source_path)
+        name = self.cache_name(source_path, stat)
+        path = self.cache_dir / name
+
+        with self._lock:
+            cached = name in self._entries
+        if cached:
+            try:
+                if path.stat().st_size == stat.st_size:
+                    os.utime(path)  # Mark as recently used
+                    with self._lock:
+                        if name in self._entries:
+                            self._entries.move_to_end(name)
+                        self.hits += 1
+                    return path
+            except OSError:
+                pass
+            self._remove(name)
+
+        with self._lock:
+            self.misses += 1
+        self._copy(source_path, name, stat.st_size)
+        return path
+
+    def _copy(self, source_path, name, size):
+        """Copy a source file into the cache (atomic rename), replacing older versions"""
+        tmp_path = self.cache_dir / f"{name}.{threading.get_ident()}.tmp"
+        shutil.copyfile(source_path, tmp_path)
+        if tmp_path.stat().st_size != size:
+            tmp_path.unlink(missing_ok=True)
+            raise OSError(f"Incomplete copy of {source_path}")
+        os.replace(tmp_path, self.cache_dir / name)
+
+        prefix = name.split('_', 1)[0] + '_'
+        with self._lock:
+            stale = [other for other in self._entries if other.startswith(prefix) and other != name]
+            if name in self._entries:
+                self.total_bytes -= self._entries.pop(name)
+            self._entries[name] = size
+            self.total_bytes += size
+        for other in stale:
+            self._remove(other)
+        self._evict()
+
+    def _remove(self, name):
+        with self._lock:
+            if name not in self._entries:
+                return
+            size = self._entries.pop(name)
+            self.total_bytes -= size
+        self._unlink(name, size)
+
+    def _evict(self):
+        """Remove least recently used copies until the cache fits its cap"""
+        skipped = set()
+        while True:
+            with self._lock:
+                if self.total_bytes <= self.max_bytes or len(self._entries) <= 1:
+                    return
+                name = next((name for name in self._entries if name not in skipped), None)
+                if name is None:
+                    return
+                size = self._entries.pop(name)
+                self.total_bytes -= size
+            if not self._unlink(name, size):
+                skipped.add(name)
+
+    def _unlink(self, name, size):
+        """
+        Delete a cached copy; one that cannot be deleted (e.g. still open on Windows)
+        is kept as most recently used so a later eviction retries it
+        """
+        try:
+            (self.cache_dir / name).unlink(missing_ok=True)
+            return True
+        except OSError as e:
+            print(f"⚠️ Could not remove cached image {name}: {e}")
+            with self._lock:
+                if name not in self._entries:
+                    self._entries[name] = size
+                    self.total_bytes += size
+            return False
+
+    def warm(self, source_paths):
+        """Copy upcoming images to local disk in the background (no decoding)"""
+        for source_path in source_paths:
+            source_path = str(source_path)
+            with self._lock:
+                if source_path in self._warming:
+                    continue
+                self._warming.add(source_path)
+            self._executor.submit(self._warm_one, source_path)
+
+    def _warm_one(self, source_path):
+        try:
+            self.local_path(source_path)
+        except OSError:
+            pass  # Missing files are reported when the image is shown
+        finally:
+            with self._lock:
+                self._warming.discard(source_path)
+
+    def stats(self):
+        """Counters for display: entries, bytes, hits, misses"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.total_bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+@st.cache_resource(show_spinner=False)
+def get_disk_cache():
+    """Disk cache shared by all sessions of this process (None when disabled)"""
+    if IMAGE_DISK_CACHE_GB <= 0:
+        return None
+    return DiskImageCache(IMAGE_CACHE_DIR, int(IMAGE_DISK_CACHE_GB * 1024**3))
+
+
+def local_image_path(source_path):
+    """Path to read an image from: the local copy when the disk cache is enabled"""
+    cache = get_disk_cache()
+    if cache is None:
+        return Path(source_path)
+    return cache.local_path(source_path)
@@ -0,0 +1,60 @@
+"""
+Bounded LRU memo for exam-level clinical context lookups
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class ExamMemo:
+    """
+    Thread-safe LRU memo with hit/miss counters
+
+    Keys are exam keys such as (pat_mrn, exam_date); all photos of one exam
+    share the cached value, so values must be treated as read-only.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_or_compute(self, key, compute):
+        """Cached value for key, or compute() stored as the most recent entry"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        # Computed outside the lock: a concurrent miss on the same key only repeats the lookup
+        value = compute()
+
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        """Counters for display: entries, hits, misses, hit_rate (0-1)"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
@@ -0,0 +1,212 @@
+"""
+Display-resolution image service with a cross-session cache
+
+Originals are decoded once, turned upright (EXIF orientation), downscaled to
+the display width and encoded as JPEG/WebP - or taken from the previews
+prebuilt by preprocessing/create_image_previews.py. The encoded bytes are
+cached for all sessions under a byte budget, so a rerun or a revisit costs a
+lookup - the original's size/mtime are re-read at most once per IMAGE_STAT_TTL.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from pathlib import Path
+import streamlit as st
+from config.config import (
+    DISPLAY_IMAGE_WIDTH,
+    DISPLAY_IMAGE_FORMAT,
+    DISPLAY_IMAGE_QUALITY,
+    THUMBNAIL_WIDTH,
+    IMAGE_CACHE_MB,
+    IMAGE_STAT_TTL,
+    PREVIEW_CACHE_DIR
+)
+from utils.disk_cache import get_disk_cache, local_image_path
+from preprocessing.image_previews import encode_image, preview_file, preview_settings, read_manifest, MANIFEST_NAME
+from utils.tile_cache import get_tile_cache
+
+
+def encode_display_image(path, width=DISPLAY_IMAGE_WIDTH):
+    """Upright, downscaled (never upscaled) copy of an image with the display format/quality"""
+    return encode_image(path, width, DISPLAY_IMAGE_FORMAT, DISPLAY_IMAGE_QUALITY)
+
+
+# Originals whose last size/mtime check is remembered
+MAX_SOURCE_VERSIONS = 20000
+
+
+class ImageCache:
+    """Thread-safe LRU of encoded images bounded by total size in bytes"""
+
+    def __init__(self, max_bytes, stat_ttl=IMAGE_STAT_TTL):
+        self.max_bytes = max_bytes
+        self.stat_ttl = stat_ttl
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._versions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def source_version(self, path):
+        """
+        (size, mtime_ns) of an original, read from the share at most once per stat_ttl seconds
+        Raises OSError if the file is missing when it is checked
+        """
+        path = str(path)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._versions.get(path)
+            if entry is not None and now - entry[2] < self.stat_ttl:
+                self._versions.move_to_end(path)
+                return entry[:2]
+
+        stat = os.stat(path)
+        with self._lock:
+            self._versions[path] = (stat.st_size, stat.st_mtime_ns, now)
+            self._versions.move_to_end(path)
+            while len(self._versions) > MAX_SOURCE_VERSIONS:
+                self._versions.popitem(last=False)
+        return stat.st_size, stat.st_mtime_ns
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= len(self._entries.pop(key))
+            if len(data) > self.max_bytes:
+                return
+            self._entries[key] = data
+            self.total_bytes += len(data)
+            while self.total_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.total_bytes -= len(evicted)
+
+    def stats(self):
+        """Counters for display: entries, bytes, hits, misses"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.total_bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+@st.cache_resource(show_spinner=False)
+def get_image_cache():
+    """Display image cache shared by all sessions of this process"""
+    return ImageCache(IMAGE_CACHE_MB * 1024 * 1024)
+
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def get_preview_manifest(signature):
+    """
+    image_path -> (size, mtime_ns, digest) of the prebuilt previews
+    (create_image_previews.py); empty if they were built with other settings
+    signature: (path, size, mtime) of the manifest, so a rebuild is picked up
+    """
+    manifest_df, settings = read_manifest(PREVIEW_CACHE_DIR)
+    expected = preview_settings([DISPLAY_IMAGE_WIDTH, THUMBNAIL_WIDTH], DISPLAY_IMAGE_FORMAT, DISPLAY_IMAGE_QUALITY)
+    if settings != expected:
+        if settings:
+            print("   ⚠️  Image previews were built with other display settings - encoding on request")
+        return {}
+    return dict(zip(
+        manifest_df['image_path'].tolist(),
+        zip(manifest_df['size'].tolist(), manifest_df['mtime_ns'].tolist(), manifest_df['digest'].tolist())
+    ))
+
+
+def current_preview_manifest():
+    """Manifest of the prebuilt previews as currently on disk (empty if there are none)"""
+    manifest_path = Path(PREVIEW_CACHE_DIR) / MANIFEST_NAME
+    if not manifest_path.exists():
+        return {}
+    manifest_stat = manifest_path.stat()
+    return get_preview_manifest((str(manifest_path), manifest_stat.st_size, manifest_stat.st_mtime_ns))
+
+
+def image_resources():
+    """
+    The shared caches get_image works with, resolved on the script thread
+    Pass them to get_image from worker threads, which cannot call cache_resource functions
+    """
+    return {
+        'image_cache': get_image_cache(),
+        'disk_cache': get_disk_cache(),
+        'preview_manifest': current_preview_manifest()
+    }
+
+
+def prebuilt_preview(path, version, width, manifest):
+    """Path of an up-to-date prebuilt preview of the original, or None"""
+    entry = manifest.get(str(path))
+    if entry is None or entry[:2] != version:
+        return None
+    preview = preview_file(PREVIEW_CACHE_DIR, entry[2], width, DISPLAY_IMAGE_FORMAT)
+    return preview if preview.exists() else None
+
+
+def get_image(path, width, resources=None):
+    """
+    Bytes of an image file at the given width, from the shared cache when possible
+    Misses use the prebuilt preview if there is one, else encode the original
+    (read through the local disk cache). The key includes size and mtime, so a
+    replaced file is re-encoded once its next check (IMAGE_STAT_TTL) sees it.
+    resources: image_resources(), required off the script thread
+    Raises OSError / PIL errors for missing or unreadable files
+    """
+    resources = resources or image_resources()
+    cache = resources['image_cache']
+    version = cache.source_version(path)
+    key = (str(path), *version, width, DISPLAY_IMAGE_FORMAT, DISPLAY_IMAGE_QUALITY)
+
+    data = cache.get(key)
+    if data is None:
+        preview = prebuilt_preview(path, version, width, resources['preview_manifest'])
+        if preview is not None:
+            data = preview.read_bytes()
+        else:
+            disk_cache = resources['disk_cache']
+            source = disk_cache.local_path(path) if disk_cache is not None else Path(path)
+            data = encode_display_image(source, width)
+        cache.put(key, data)
+    return data
+
+
+def get_display_image(path, resources=None):
+    """Display-size bytes of an image (see get_image)"""
+    return get_image(path, DISPLAY_IMAGE_WIDTH, resources)
+
+
+def get_thumbnail(path):
+    """Thumbnail bytes of an image, for grid and review views (see get_image)"""
+    return get_image(path, THUMBNAIL_WIDTH)
+
+
+def get_zoom_view(path, zoom, center_x, center_y):
+    """
+    Display-width view of part of an image for the zoom viewer: only the
+    pyramid tiles intersecting the view are read (levels are cut on first use)
+    center_x / center_y: view center as a fraction (0-1) of width / height
+    Returns: (bytes, (x0, y0, x1, y1) visible region as fractions)
+    """
+    stat = Path(path).stat()
+    tile_cache = get_tile_cache()
+    pyramid = tile_cache.pyramid(f"{path}|{stat.st_size}|{stat.st_mtime_ns}", local_image_path(path))
+    try:
+        return pyramid.render_view(zoom, center_x, center_y, DISPLAY_IMAGE_WIDTH, DISPLAY_IMAGE_FORMAT, DISPLAY_IMAGE_QUALITY)
+    finally:
+        tile_cache.record_use(pyramid)
@@ -1,37 +1,243 @@
 """
 Label management module for saving and loading labels
+
+Each user has a snapshot, {username}_labels.json, plus an append-only journal
+of the changes made since, {username}_labels.<generation>.jsonl (one JSON event
+per line). A save appends one line; loading replays the journals on top of
+the snapshot. Every LABEL_JOURNAL_COMPACT_EVERY events a background thread
+writes a new snapshot and removes the journals it covers.
+
+With LABEL_STORE_BACKEND=sqlite the same events are written to the shared
+SQLite store instead (utils/label_store.py).
 """
 
+import os
 import json
+import threading
+import numpy as np
 from pathlib import Path
 from datetime import datetime
-from config.config import LABELS_DIR, DATETIME_FORMAT
+from config.config import (
+    LABELS_DIR,
+    DATETIME_FORMAT,
+    LABEL_JOURNAL_COMPACT_EVERY,
+    LABEL_STORE_BACKEND,
+    LABELS_DB_PATH
+)
+from utils.label_store import LabelStore
+from utils.label_stats import (
+    count_label,
+    count_labels,
+    statistics_from_counters,
+    counters_to_json,
+    counters_from_json
+)
+
+_label_stores = {}
+_label_stores_lock = threading.Lock()
+
+def _load_json_users():
+    """Labels of every user with a JSON labels file (snapshot + journal)"""
+    for labels_file in LABELS_DIR.glob("*_labels.json"):
+        username = labels_file.stem.replace("_labels", "")
+        yield LabelManager(username, backend="json").labels
+
+def get_label_store():
+    """SQLite label store shared by all sessions of this process; imports the JSON files on first use"""
+    with _label_stores_lock:
+        store = _label_stores.get(LABELS_DB_PATH)
+        if store is None:
+            store = LabelStore(LABELS_DB_PATH)
+            if not store.is_migrated():
+                imported = store.migrate(_load_json_users, datetime.now().strftime(DATETIME_FORMAT))
+                if imported:
+                    print(f"✅ Imported labels of {imported} users into {LABELS_DB_PATH}")
+            _label_stores[LABELS_DB_PATH] = store
+        return store
 
 class LabelManager:
     """Class to manage label saving and loading"""
     
-    def __init__(self, username):
+    def __init__(self, username, backend=None):
+        """backend: "json" or "sqlite" (default: LABEL_STORE_BACKEND)"""
         self.username = username
         self.labels_file = LABELS_DIR / f"{username}_labels.json"
+        self.store = get_label_store() if (backend or LABEL_STORE_BACKEND) == "sqlite" else None
+        self._lock = threading.RLock()
+        self._save_lock = threading.Lock()
+        self._compacting = False
+        self._route = None
+        self._route_array = None
+        self._route_labeled = None
         self.labels = self.load_labels()
     
+    def journal_file(self, generation):
+        """Journal holding the events written after snapshot generation - 1"""
+        return LABELS_DIR / f"{self.username}_labels.{generation}.jsonl"
+    
+    def journal_files(self):
+        """Existing journals as (generation, path), oldest first"""
+        journals = []
+        for path in LABELS_DIR.glob(f"{self.username}_labels.*.jsonl"):
+            generation = path.name[len(f"{self.username}_labels."):-len(".jsonl")]
+            if generation.isdigit():
+                journals.append((int(generation), path))
+        return sorted(journals)
+    
     def load_labels(self):
-        """Load existing labels for this user"""
+        """Load existing labels for this user (snapshot + journal replay, or the SQLite store)"""
+        if self.store is not None:
+            now = datetime.now().strftime(DATETIME_FORMAT)
+            self.labels = self.store.load_user(self.username, now) or {
+                "user": self.username,
+                "created_at": now,
+                "last_modified": now,
+                "labels": {}
+            }
+            self._counters = self.store.user_counters(self.username)
+            self._build_studyid_index()
+            return self.labels
+        
         if self.labels_file.exists():
             with open(self.labels_file, 'r') as f:
-                return json.load(f)
-        return {
-            "user": self.username,
-            "created_at": datetime.now().strftime(DATETIME_FORMAT),
-            "last_modified": datetime.now().strftime(DATETIME_FORMAT),
-            "labels": {}
-        }
+                labels = json.load(f)
+        else:
+            labels = {
+                "user": self.username,
+                "created_at": datetime.now().strftime(DATETIME_FORMAT),
+                "last_modified": datetime.now().strftime(DATETIME_FORMAT),
+                "labels": {}
+            }
+        
+        # Journals up to snapshot_generation are already folded into the snapshot
+        snapshot_generation = labels.pop("journal_generation", 0)
+        counters = labels.pop("statistics", None)
+        self._counters = counters_from_json(counters) if counters is not None else count_labels(labels["labels"])
+        self.labels = labels
+        self._generation = snapshot_generation + 1
+        self._journal_events = 0
+        for generation, path in self.journal_files():
+            if generation <= snapshot_generation:
+                continue
+            self._generation = generation
+            torn_tail = False
+            with open(path, 'r', encoding='utf-8') as f:
+                for line_number, line in enumerate(f, start=1):
+                    # Only the last line can lack its newline (interrupted append)
+                    torn_tail = not line.endswith("\n")
+                    try:
+                        event = json.loads(line)
+                    except json.JSONDecodeError:
+                        print(f"⚠️ Skipping unreadable line {line_number} of {path.name}")
+                        continue
+                    self._apply_event(event)
+                    self._journal_events += 1
+            if torn_tail:
+                # Appending after a partial line would glue the next event onto it:
+                # continue in a fresh journal (the file is left alone, another session may still append)
+                print(f"⚠️ {path.name} ends with an incomplete line - new saves go to the next journal")
+                self._generation = generation + 1
+        self._build_studyid_index()
+        return self.labels
+    
+    def _build_studyid_index(self):
+        """
+        maskedid_studyid -> key of its most recent label (for autofill)
+        Of labels saved in the same second, the later one wins
+        """
+        self._studyid_index = {}
+        for image_key, label_data in self.labels["labels"].items():
+            self._index_studyid(image_key, label_data)
+    
+    def _index_studyid(self, image_key, label_data):
+        """Point the label's studyid at image_key unless it already points at a newer label"""
+        studyid = label_data.get("metadata", {}).get("maskedid_studyid")
+        if studyid is None:
+            return
+        current = self._studyid_index.get(studyid)
+        if (current is None or
+                (label_data.get("labeled_at") or "") >= (self.labels["labels"][current].get("labeled_at") or "")):
+            self._studyid_index[studyid] = image_key
+    
+    def _apply_event(self, event):
+        """Apply one journal event to the in-memory labels"""
+        key = event["key"]
+        if event["op"] == "label":
+            # Statistics counters: remove the replaced version, add the new one
+            if key in self.labels["labels"]:
+                count_label(self._counters, self.labels["labels"][key], -1)
+            count_label(self._counters, event["label"], 1)
+            self.labels["labels"][key] = event["label"]
+        elif event["op"] == "review_add":
+            self.labels.setdefault("review_queue", [])
+            if key not in self.labels["review_queue"]:
+                self.labels["review_queue"].append(key)
+        elif event["op"] == "review_remove":
+            if key in self.labels.get("review_queue", []):
+                self.labels["review_queue"].remove(key)
+        self.labels["last_modified"] = event["at"]
+    
+    def _record(self, event):
+        """Apply an event and append it to the journal (one line, flushed to disk) or the SQLite store"""
+        with self._lock:
+            previous = self.labels["labels"].get(event["key"]) if event["op"] == "label" else None
+            self._apply_event(event)
+            if event["op"] == "label":
+                self._mark_labeled(event["key"])
+            if self.store is not None:
+                self.store.record(self.username, event, self.labels["created_at"], previous)
+                return
+            line = json.dumps(event) + "\n"
+            with open(self.journal_file(self._generation), 'a', encoding='utf-8') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._journal_events += 1
+            compact = self._journal_events >= LABEL_JOURNAL_COMPACT_EVERY and not self._compacting
+            if compact:
+                self._compacting = True
+        
+        # First save of a new user: create the labels file (admin views list users by it)
+        if not self.labels_file.exists():
+            self.save_labels()
+        elif compact:
+            threading.Thread(target=self.save_labels, daemon=True).start()
     
     def save_labels(self):
-        """Save labels to file"""
-        self.labels["last_modified"] = datetime.now().strftime(DATETIME_FORMAT)
-        with open(self.labels_file, 'w') as f:
-            json.dump(self.labels, f, indent=2)
+        """
+        Write a full snapshot and drop the journals it covers
+        New events go to the next journal generation while the snapshot is written
+        (nothing to do for the SQLite store: every event is already committed)
+        """
+        if self.store is not None:
+            return
+        with self._save_lock:
+            self._write_snapshot()
+    
+    def _write_snapshot(self):
+        with self._lock:
+            generation = self._generation
+            snapshot = json.dumps({
+                **self.labels,
+                "statistics": counters_to_json(self._counters),
+                "journal_generation": generation
+            }, indent=2)
+            self._generation += 1
+            self._journal_events = 0
+        
+        try:
+            tmp_file = self.labels_file.with_name(f"{self.labels_file.name}.tmp")
+            with open(tmp_file, 'w') as f:
+                f.write(snapshot)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.labels_file)
+            
+            for journal_generation, path in self.journal_files():
+                if journal_generation <= generation:
+                    path.unlink(missing_ok=True)
+        finally:
+            self._compacting = False
     
     def add_label(self, image_index, image_path, laterality, quality, 
                   conditions=None, metadata=None):
@@ -51,9 +257,11 @@ class LabelManager:
         - metadata: Additional metadata
         """
         image_key = str(image_index)
+        now = datetime.now().strftime(DATETIME_FORMAT)
         
         # Check if this is an edit
         is_edit = image_key in self.labels["labels"]
+        previous_studyid = self.labels["labels"][image_key].get("metadata", {}).get("maskedid_studyid") if is_edit else None
         
         label_data = {
             "image_path": image_path,
@@ -61,208 +269,100 @@ class LabelManager:
             "quality": quality,
             "conditions": conditions or {},
             "labeled_by": self.username,
-            "labeled_at": datetime.now().strftime(DATETIME_FORMAT),
+            "labeled_at": now,
             "is_edit": is_edit,
             "metadata": metadata or {}
         }
         
-        # If it's an edit, keep history
-        if is_edit:
-            if "edit_history" not in self.labels["labels"][image_key]:
-                self.labels["labels"][image_key]["edit_history"] = []
-            
-            # Save previous version to history
-            previous = {k: v for k, v in self.labels["labels"][image_key].items() 
-                       if k != "edit_history"}
-            previous["edited_at"] = datetime.now().strftime(DATETIME_FORMAT)
-            self.labels["labels"][image_key]["edit_history"].append(previous)
+        # Only this label is written (appended to the journal)
+        self._record({"op": "label", "key": image_key, "label": label_data, "at": now})
         
-        self.labels["labels"][image_key] = label_data
-        self.save_labels()
+        # The new save is the most recent label of its studyid
+        self._index_studyid(image_key, label_data)
+        if previous_studyid is not None and self._studyid_index.get(previous_studyid) == image_key \
+                and previous_studyid != label_data["metadata"].get("maskedid_studyid"):
+            # The label moved to another studyid: fall back to the newest remaining label of the old one
+            del self._studyid_index[previous_studyid]
+            for key, other in self.labels["labels"].items():
+                if other.get("metadata", {}).get("maskedid_studyid") == previous_studyid:
+                    self._index_studyid(key, other)
     
     def get_label(self, image_index):
         """Get label for a specific image"""
         return self.labels["labels"].get(str(image_index))
     
+    def get_edit_history(self, image_index):
+        """Previous versions of a label, oldest first (kept by the SQLite store)"""
+        if self.store is not None:
+            return self.store.edit_history(self.username, str(image_index))
+        label = self.get_label(image_index) or {}
+        return label.get("edit_history", [])
+    
     def is_labeled(self, image_index):
         """Check if an image has been labeled"""
         return str(image_index) in self.labels["labels"]
     
-    def get_labeled_count(self):
-        """Get count of labeled images"""
+    def get_labeled_count(self, route_indices=None):
+        """Get count of labeled images (only those in the route, if given)"""
+        if route_indices is not None:
+            return int(self._route_bitmap(route_indices).sum())
         return len(self.labels["labels"])
     
+    def _route_bitmap(self, route_indices):
+        """
+        Labeled flag for every route position
+        Built once per route (the route list is kept in the session) and updated by saves
+        """
+        with self._lock:
+            if self._route is not route_indices or len(self._route_labeled) != len(route_indices):
+                route = np.asarray(route_indices, dtype=np.int64)
+                labeled = np.fromiter(
+                    (int(key) for key in self.labels["labels"] if key.lstrip('-').isdigit()),
+                    dtype=np.int64
+                )
+                self._route = route_indices
+                self._route_array = route
+                self._route_labeled = np.isin(route, labeled)
+            return self._route_labeled
+    
+    def _mark_labeled(self, image_key):
+        """Set the bitmap flag of a newly labeled image"""
+        if self._route_array is not None and image_key.lstrip('-').isdigit():
+            self._route_labeled[self._route_array == int(image_key)] = True
+    
     def get_last_labeled_index(self, route_indices):
         """Get the last labeled index in the route"""
-        for i in range(len(route_indices) - 1, -1, -1):
-            if self.is_labeled(route_indices[i]):
-                return i
-        return -1
+        labeled = self._route_bitmap(route_indices)
+        if not labeled.any():
+            return -1
+        return len(labeled) - 1 - int(labeled[::-1].argmax())
     
     def get_next_unlabeled_index(self, route_indices, current_position=0):
         """Get the next unlabeled index in the route"""
-        for i in range(current_position, len(route_indices)):
-            if not self.is_labeled(route_indices[i]):
-                return i
-        return None
+        remaining = self._route_bitmap(route_indices)[current_position:]
+        if remaining.all():
+            return None
+        return current_position + int(remaining.argmin())
     
     def get_statistics(self):
-        """Get statistics about labels"""
-        labels = self.labels["labels"]
-        total = len(labels)
-        
-        if total == 0:
-            return {
-                "total": 0,
-                "by_laterality": {},
-                "by_quality": {},
-                "by_condition": {},
-                "edited": 0
-            }
-        
-        stats = {
-            "total": total,
-            "by_laterality": {},
-            "by_quality": {},
-            "by_condition": {},
-            "edited": 0
-        }
-        
-        for label in labels.values():
-            # Count by laterality
-            lat = label["laterality"]
-            stats["by_laterality"][lat] = stats["by_laterality"].get(lat, 0) + 1
-            
-            # Count by quality
-            quality = label["quality"]
-            stats["by_quality"][quality] = stats["by_quality"].get(quality, 0) + 1
-            
-            # Count by condition (if usable)
-            if quality == "Usable":
-                conditions = label.get("conditions", {})
-                for condition_name in conditions.keys():
-                    stats["by_condition"][condition_name] = stats["by_condition"].get(condition_name, 0) + 1
-            
-            # Count edits
-            if label.get("is_edit", False):
-                stats["edited"] += 1
-        
-        return stats
+        """Get statistics about labels (from the counters kept up to date by each save)"""
+        with self._lock:
+            return statistics_from_counters(self._counters)
     
     def get_detailed_statistics(self):
         """Get detailed statistics including condition-specific data"""
-        labels = self.labels["labels"]
-        stats = self.get_statistics()
-        
-        # Add detailed statistics per condition
-        stats["detailed"] = {
-            "dry_eye": {"by_severity": {}, "by_signs": {}},
-            "cataract": {"by_type": {}, "by_severity": {}, "by_features": {}},
-            "infectious": {"by_type": {}, "by_etiology": {}, "by_size": {}},
-            "tumor": {"by_type": {}, "by_malignancy": {}, "by_location": {}},
-            "sch": {"by_presence": {}, "by_extent": {}}
-        }
-        
-        for label in labels.values():
-            if label.get("quality") != "Usable":
-                continue
-                
-            conditions = label.get("conditions", {})
-            
-            # Dry Eye Disease
-            if "Dry Eye Disease" in conditions:
-                data = conditions["Dry Eye Disease"]
-                severity = data.get("severity")
-                if severity:
-                    stats["detailed"]["dry_eye"]["by_severity"][severity] = \
-                        stats["detailed"]["dry_eye"]["by_severity"].get(severity, 0) + 1
-                
-                for sign in data.get("signs", []):
-                    stats["detailed"]["dry_eye"]["by_signs"][sign] = \
-                        stats["detailed"]["dry_eye"]["by_signs"].get(sign, 0) + 1
-            
-            # Cataract
-            if "Cataract" in conditions:
-                data = conditions["Cataract"]
-                cat_type = data.get("type")
-                if cat_type:
-                    stats["detailed"]["cataract"]["by_type"][cat_type] = \
-                        stats["detailed"]["cataract"]["by_type"].get(cat_type, 0) + 1
-                
-                severity = data.get("severity")
-                if severity:
-                    stats["detailed"]["cataract"]["by_severity"][severity] = \
-                        stats["detailed"]["cataract"]["by_severity"].get(severity, 0) + 1
-                
-                for feature in data.get("features", []):
-                    stats["detailed"]["cataract"]["by_features"][feature] = \
-                        stats["detailed"]["cataract"]["by_features"].get(feature, 0) + 1
-            
-            # Infectious Keratitis / Conjunctivitis
-            if "Infectious Keratitis / Conjunctivitis" in conditions:
-                data = conditions["Infectious Keratitis / Conjunctivitis"]
-                inf_type = data.get("type")
-                if inf_type:
-                    stats["detailed"]["infectious"]["by_type"][inf_type] = \
-                        stats["detailed"]["infectious"]["by_type"].get(inf_type, 0) + 1
-                
-                etiology = data.get("etiology")
-                if etiology:
-                    stats["detailed"]["infectious"]["by_etiology"][etiology] = \
-                        stats["detailed"]["infectious"]["by_etiology"].get(etiology, 0) + 1
-                
-                size = data.get("keratitis_size")
-                if size:
-                    stats["detailed"]["infectious"]["by_size"][size] = \
-                        stats["detailed"]["infectious"]["by_size"].get(size, 0) + 1
-            
-            # Ocular Surface Tumors
-            if "Ocular Surface Tumors" in conditions:
-                data = conditions["Ocular Surface Tumors"]
-                tumor_type = data.get("type")
-                if tumor_type:
-                    stats["detailed"]["tumor"]["by_type"][tumor_type] = \
-                        stats["detailed"]["tumor"]["by_type"].get(tumor_type, 0) + 1
-                
-                malignancy = data.get("malignancy")
-                if malignancy:
-                    stats["detailed"]["tumor"]["by_malignancy"][malignancy] = \
-                        stats["detailed"]["tumor"]["by_malignancy"].get(malignancy, 0) + 1
-                
-                location = data.get("location")
-                if location:
-                    stats["detailed"]["tumor"]["by_location"][location] = \
-                        stats["detailed"]["tumor"]["by_location"].get(location, 0) + 1
-            
-            # Subconjunctival Hemorrhage
-            if "Subconjunctival Hemorrhage" in conditions:
-                data = conditions["Subconjunctival Hemorrhage"]
-                presence = data.get("presence")
-                if presence:
-                    stats["detailed"]["sch"]["by_presence"][presence] = \
-                        stats["detailed"]["sch"]["by_presence"].get(presence, 0) + 1
-                
-                extent = data.get("extent")
-                if extent:
-                    stats["detailed"]["sch"]["by_extent"][extent] = \
-                        stats["detailed"]["sch"]["by_extent"].get(extent, 0) + 1
-        
-        return stats
+        with self._lock:
+            return statistics_from_counters(self._counters, detailed=True)
     
     def add_to_review_queue(self, image_index):
         """Add an image to review queue"""
-        if "review_queue" not in self.labels:
-            self.labels["review_queue"] = []
-        
-        if str(image_index) not in self.labels["review_queue"]:
-            self.labels["review_queue"].append(str(image_index))
-            self.save_labels()
+        if str(image_index) not in self.labels.get("review_queue", []):
+            self._record({"op": "review_add", "key": str(image_index), "at": datetime.now().strftime(DATETIME_FORMAT)})
     
     def remove_from_review_queue(self, image_index):
         """Remove an image from review queue"""
-        if "review_queue" in self.labels and str(image_index) in self.labels["review_queue"]:
-            self.labels["review_queue"].remove(str(image_index))
-            self.save_labels()
+        if str(image_index) in self.labels.get("review_queue", []):
+            self._record({"op": "review_remove", "key": str(image_index), "at": datetime.now().strftime(DATETIME_FORMAT)})
     
     def get_review_queue(self):
         """Get review queue"""
@@ -276,47 +376,33 @@ class LabelManager:
         if not studyid:
             return None
         
-        # Find all labels with this studyid, sorted by labeled_at (most recent first)
-        matching_labels = []
-        for image_key, label_data in self.labels["labels"].items():
-            label_studyid = label_data.get("metadata", {}).get("maskedid_studyid")
-            if label_studyid == studyid:
-                matching_labels.append({
-                    "image_key": image_key,
-                    "labeled_at": label_data.get("labeled_at"),
-                    "laterality": label_data.get("laterality"),
-                    "quality": label_data.get("quality"),
-                    "conditions": label_data.get("conditions", {})
-                })
-        
-        if not matching_labels:
+        # The studyid index always points at the most recent label
+        image_key = self._studyid_index.get(studyid)
+        if image_key is None:
             return None
         
-        # Sort by labeled_at (most recent first)
-        matching_labels.sort(key=lambda x: x["labeled_at"], reverse=True)
-        
-        # Return the most recent label
-        most_recent = matching_labels[0]
+        most_recent = self.labels["labels"][image_key]
         return {
-            "laterality": most_recent["laterality"],
-            "quality": most_recent["quality"],
-            "conditions": most_recent["conditions"]
+            "laterality": most_recent.get("laterality"),
+            "quality": most_recent.get("quality"),
+            "conditions": most_recent.get("conditions", {})
         }
     
     @staticmethod
     def get_all_user_stats():
         """Get statistics for all users"""
+        if LABEL_STORE_BACKEND == "sqlite":
+            return get_label_store().user_statistics()
+        
         all_stats = {}
         
         for labels_file in LABELS_DIR.glob("*_labels.json"):
             username = labels_file.stem.replace("_labels", "")
             
-            with open(labels_file, 'r') as f:
-                data = json.load(f)
-            
+            # Loading replays the journal, so recent saves are included
             manager = LabelManager(username)
-            manager.labels = data
-            stats = manager.get_statistics()
+            data = manager.labels
+            stats = manager.get_detailed_statistics()
             
             all_stats[username] = {
                 "created_at": data.get("created_at"),
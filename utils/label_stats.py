@@ -0,0 +1,98 @@
+"""
+Label statistics kept as counters
+
+Every label contributes +1 to a set of (category, value) counters, e.g.
+("by_quality", "Usable") or ("detailed.cataract.by_type", "Nuclear"). Saving
+a label subtracts the counters of the version it replaces and adds its own,
+so the statistics never have to be recomputed from all labels.
+"""
+
+# (condition, detailed group, statistic, field in the condition data, field holds a list)
+DETAILED_FIELDS = [
+    ("Dry Eye Disease", "dry_eye", "by_severity", "severity", False),
+    ("Dry Eye Disease", "dry_eye", "by_signs", "signs", True),
+    ("Cataract", "cataract", "by_type", "type", False),
+    ("Cataract", "cataract", "by_severity", "severity", False),
+    ("Cataract", "cataract", "by_features", "features", True),
+    ("Infectious Keratitis / Conjunctivitis", "infectious", "by_type", "type", False),
+    ("Infectious Keratitis / Conjunctivitis", "infectious", "by_etiology", "etiology", False),
+    ("Infectious Keratitis / Conjunctivitis", "infectious", "by_size", "keratitis_size", False),
+    ("Ocular Surface Tumors", "tumor", "by_type", "type", False),
+    ("Ocular Surface Tumors", "tumor", "by_malignancy", "malignancy", False),
+    ("Ocular Surface Tumors", "tumor", "by_location", "location", False),
+    ("Subconjunctival Hemorrhage", "sch", "by_presence", "presence", False),
+    ("Subconjunctival Hemorrhage", "sch", "by_extent", "extent", False),
+]
+
+
+def label_counters(label):
+    """(category, value) counters one label contributes to"""
+    counters = [
+        ("total", ""),
+        ("by_laterality", label["laterality"]),
+        ("by_quality", label["quality"])
+    ]
+    if label.get("is_edit", False):
+        counters.append(("edited", ""))
+
+    # Conditions are only counted for usable images
+    if label.get("quality") == "Usable":
+        conditions = label.get("conditions") or {}
+        counters.extend(("by_condition", name) for name in conditions)
+        for condition, group, statistic, field, is_list in DETAILED_FIELDS:
+            if condition not in conditions:
+                continue
+            data = conditions[condition] or {}
+            values = (data.get(field) or []) if is_list else [data.get(field)]
+            counters.extend((f"detailed.{group}.{statistic}", value) for value in values if value)
+    return counters
+
+
+def count_label(counters, label, delta):
+    """Add delta (+1 / -1) to every counter of a label; counters reaching 0 are removed"""
+    for key in label_counters(label):
+        count = counters.get(key, 0) + delta
+        if count:
+            counters[key] = count
+        else:
+            counters.pop(key, None)
+
+
+def count_labels(labels):
+    """Counters of a dict of labels (used when no saved counters exist)"""
+    counters = {}
+    for label in labels.values():
+        count_label(counters, label, 1)
+    return counters
+
+
+def statistics_from_counters(counters, detailed=False):
+    """LabelManager.get_statistics() (or get_detailed_statistics()) layout from counters"""
+    stats = {
+        "total": counters.get(("total", ""), 0),
+        "by_laterality": {},
+        "by_quality": {},
+        "by_condition": {},
+        "edited": counters.get(("edited", ""), 0)
+    }
+    if detailed:
+        stats["detailed"] = {}
+        for _, group, statistic, _, _ in DETAILED_FIELDS:
+            stats["detailed"].setdefault(group, {})[statistic] = {}
+
+    for (category, value), count in counters.items():
+        if category in ("by_laterality", "by_quality", "by_condition"):
+            stats[category][value] = count
+        elif detailed and category.startswith("detailed."):
+            _, group, statistic = category.split(".")
+            stats["detailed"][group][statistic][value] = count
+    return stats
+
+
+def counters_to_json(counters):
+    """JSON-serializable form: [[category, value, count], ...]"""
+    return [[category, value, count] for (category, value), count in counters.items()]
+
+
+def counters_from_json(rows):
+    return {(category, value): count for category, value, count in rows}
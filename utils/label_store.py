@@ -0,0 +1,284 @@
+"""
+SQLite label store shared by all users (LABEL_STORE_BACKEND=sqlite)
+
+    users           username, created_at, last_modified
+    labels          one row per (username, image_key); the full label as JSON plus indexed columns
+    label_history   previous versions of edited labels
+    review_queue    (username, image_key) in the order they were added
+    label_counts    statistics counters per user (utils/label_stats.py), updated with each save
+    meta            store-level flags (e.g. the one-shot JSON migration)
+
+The database runs in WAL mode and every thread uses its own connection, so
+labelers write concurrently (each save is one short transaction) while the
+admin views read without blocking them.
+"""
+
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from utils.label_stats import label_counters, count_labels, statistics_from_counters
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    created_at TEXT,
+    last_modified TEXT
+);
+CREATE TABLE IF NOT EXISTS labels (
+    username TEXT NOT NULL,
+    image_key TEXT NOT NULL,
+    maskedid_studyid TEXT,
+    laterality TEXT,
+    quality TEXT,
+    is_edit INTEGER NOT NULL DEFAULT 0,
+    labeled_at TEXT,
+    label TEXT NOT NULL,
+    PRIMARY KEY (username, image_key)
+);
+CREATE INDEX IF NOT EXISTS idx_labels_image_key ON labels (image_key);
+CREATE INDEX IF NOT EXISTS idx_labels_studyid ON labels (username, maskedid_studyid, labeled_at);
+CREATE INDEX IF NOT EXISTS idx_labels_labeled_at ON labels (labeled_at);
+CREATE TABLE IF NOT EXISTS label_history (
+    id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL,
+    image_key TEXT NOT NULL,
+    edited_at TEXT,
+    label TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_label_history_label ON label_history (username, image_key);
+CREATE TABLE IF NOT EXISTS review_queue (
+    username TEXT NOT NULL,
+    image_key TEXT NOT NULL,
+    added_at TEXT,
+    PRIMARY KEY (username, image_key)
+);
+CREATE TABLE IF NOT EXISTS label_counts (
+    username TEXT NOT NULL,
+    category TEXT NOT NULL,
+    value TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (username, category, value)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+UPSERT_LABEL = """
+INSERT INTO labels (username, image_key, maskedid_studyid, laterality, quality, is_edit, labeled_at, label)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (username, image_key) DO UPDATE SET
+    maskedid_studyid = excluded.maskedid_studyid,
+    laterality = excluded.laterality,
+    quality = excluded.quality,
+    is_edit = excluded.is_edit,
+    labeled_at = excluded.labeled_at,
+    label = excluded.label
+"""
+
+ADD_COUNT = """
+INSERT INTO label_counts (username, category, value, count) VALUES (?, ?, ?, ?)
+ON CONFLICT (username, category, value) DO UPDATE SET count = count + excluded.count
+"""
+
+UPSERT_USER = """
+INSERT INTO users (username, created_at, last_modified) VALUES (?, ?, ?)
+ON CONFLICT (username) DO UPDATE SET last_modified = excluded.last_modified
+"""
+
+
+def _label_row(username, image_key, label):
+    return (
+        username,
+        image_key,
+        (label.get("metadata") or {}).get("maskedid_studyid"),
+        label.get("laterality"),
+        label.get("quality"),
+        int(bool(label.get("is_edit", False))),
+        label.get("labeled_at"),
+        json.dumps(label)
+    )
+
+
+class LabelStore:
+    """Labels, edit history and review queues of all users in one SQLite database"""
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        self._build_counts()
+
+    def _connection(self):
+        """This thread's connection (sqlite3 connections are not shared between threads)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit mode: transactions are opened explicitly by _transaction()
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction; IMMEDIATE takes the write lock up front instead of failing on upgrade"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _build_counts(self):
+        """Compute label_counts from the labels once (databases created before the counters existed)"""
+        with self._transaction() as conn:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'label_counts'").fetchone():
+                return
+            conn.execute("DELETE FROM label_counts")
+            users = [username for (username,) in conn.execute("SELECT username FROM users")]
+            for username in users:
+                labels = conn.execute("SELECT image_key, label FROM labels WHERE username = ?", (username,))
+                self._add_counts(conn, username, count_labels({key: json.loads(label) for key, label in labels}))
+            conn.execute("INSERT INTO meta (key, value) VALUES ('label_counts', '1')")
+
+    @staticmethod
+    def _add_counts(conn, username, deltas):
+        conn.executemany(ADD_COUNT, [
+            (username, category, value, delta) for (category, value), delta in deltas.items() if delta
+        ])
+
+    def load_user(self, username, now):
+        """Labels of one user in the LabelManager layout (None if the user has no rows yet)"""
+        conn = self._connection()
+        user = conn.execute(
+            "SELECT created_at, last_modified FROM users WHERE username = ?", (username,)
+        ).fetchone()
+        if user is None:
+            return None
+
+        labels = conn.execute(
+            "SELECT image_key, label FROM labels WHERE username = ? ORDER BY rowid", (username,)
+        )
+        review_queue = conn.execute(
+            "SELECT image_key FROM review_queue WHERE username = ? ORDER BY rowid", (username,)
+        )
+        return {
+            "user": username,
+            "created_at": user[0] or now,
+            "last_modified": user[1] or now,
+            "labels": {image_key: json.loads(label) for image_key, label in labels},
+            "review_queue": [image_key for (image_key,) in review_queue]
+        }
+
+    def user_counters(self, username):
+        """Statistics counters of one user: {(category, value): count}"""
+        rows = self._connection().execute(
+            "SELECT category, value, count FROM label_counts WHERE username = ? AND count != 0", (username,)
+        )
+        return {(category, value): count for category, value, count in rows}
+
+    def record(self, username, event, created_at, previous=None):
+        """
+        Write one LabelManager event in its own transaction
+        previous: the label replaced by a "label" event, kept in label_history
+        """
+        key, at = event["key"], event["at"]
+        with self._transaction() as conn:
+            conn.execute(UPSERT_USER, (username, created_at, at))
+            if event["op"] == "label":
+                deltas = {}
+                if previous is not None:
+                    conn.execute(
+                        "INSERT INTO label_history (username, image_key, edited_at, label) VALUES (?, ?, ?, ?)",
+                        (username, key, at, json.dumps(previous))
+                    )
+                    for counter in label_counters(previous):
+                        deltas[counter] = deltas.get(counter, 0) - 1
+                for counter in label_counters(event["label"]):
+                    deltas[counter] = deltas.get(counter, 0) + 1
+                conn.execute(UPSERT_LABEL, _label_row(username, key, event["label"]))
+                self._add_counts(conn, username, deltas)
+            elif event["op"] == "review_add":
+                conn.execute(
+                    "INSERT OR IGNORE INTO review_queue (username, image_key, added_at) VALUES (?, ?, ?)",
+                    (username, key, at)
+                )
+            elif event["op"] == "review_remove":
+                conn.execute("DELETE FROM review_queue WHERE username = ? AND image_key = ?", (username, key))
+
+    def edit_history(self, username, image_key):
+        """Previous versions of a label (with the time they were replaced as edited_at), oldest first"""
+        rows = self._connection().execute(
+            "SELECT edited_at, label FROM label_history WHERE username = ? AND image_key = ? ORDER BY id",
+            (username, image_key)
+        )
+        return [{**json.loads(label), "edited_at": edited_at} for edited_at, label in rows]
+
+    def user_statistics(self):
+        """
+        created_at, last_modified and LabelManager.get_detailed_statistics() of every user,
+        read from the counters instead of the labels
+        """
+        conn = self._connection()
+        counters = {}
+        for username, category, value, count in conn.execute(
+            "SELECT username, category, value, count FROM label_counts WHERE count != 0"
+        ):
+            counters.setdefault(username, {})[(category, value)] = count
+
+        return {
+            username: {
+                "created_at": created_at,
+                "last_modified": last_modified,
+                "statistics": statistics_from_counters(counters.get(username, {}), detailed=True)
+            }
+            for username, created_at, last_modified in conn.execute(
+                "SELECT username, created_at, last_modified FROM users ORDER BY username"
+            )
+        }
+
+    def is_migrated(self):
+        row = self._connection().execute("SELECT value FROM meta WHERE key = 'json_migrated'").fetchone()
+        return row is not None
+
+    def migrate(self, load_users, migrated_at):
+        """
+        One-shot import of the JSON label files
+        load_users: callable returning an iterable of LabelManager label dicts
+        Runs in one transaction and only if no other process has migrated yet
+        Returns: number of users imported (0 if already migrated)
+        """
+        with self._transaction() as conn:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+                return 0
+
+            imported = 0
+            for data in load_users():
+                username = data["user"]
+                conn.execute(UPSERT_USER, (username, data.get("created_at"), data.get("last_modified")))
+                for image_key, label in data.get("labels", {}).items():
+                    label = dict(label)
+                    for previous in label.pop("edit_history", None) or []:
+                        conn.execute(
+                            "INSERT INTO label_history (username, image_key, edited_at, label) VALUES (?, ?, ?, ?)",
+                            (username, image_key, previous.get("edited_at"), json.dumps(previous))
+                        )
+                    conn.execute(UPSERT_LABEL, _label_row(username, image_key, label))
+                self._add_counts(conn, username, count_labels(data.get("labels", {})))
+                for image_key in data.get("review_queue", []):
+                    conn.execute(
+                        "INSERT OR IGNORE INTO review_queue (username, image_key, added_at) VALUES (?, ?, ?)",
+                        (username, image_key, data.get("last_modified"))
+                    )
+                imported += 1
+
+            conn.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', ?)", (migrated_at,))
+            return imported
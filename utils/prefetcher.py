@@ -0,0 +1,134 @@
+"""
+Route-aware background prefetch of image records for the labeling page
+"""
+
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from config.config import PREFETCH_DEPTH, PREFETCH_WORKERS, DISK_CACHE_WARM_DEPTH
+from utils.image_service import get_display_image, image_resources
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def shared_executor():
+    """Thread pool shared by the prefetchers of all sessions"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+        return _executor
+
+
+def load_image_record(data_loader, index, resources=None):
+    """
+    Assemble everything the labeling page shows for one image
+    resources: image_resources(), required when called on a worker thread
+    Returns: dict with image_data, message, image_exists, image (display-size bytes) and image_error
+    """
+    image_data, message = data_loader.get_image_data(index)
+    record = {
+        'image_data': image_data,
+        'message': message,
+        'image_exists': False,
+        'image': None,
+        'image_error': None
+    }
+    if image_data is None:
+        return record
+
+    image_path = Path(image_data['image_path'])
+    record['image_exists'] = image_path.exists()
+    if record['image_exists']:
+        try:
+            record['image'] = get_display_image(image_path, resources)
+        except Exception as e:
+            record['image_error'] = str(e)
+    return record
+
+
+class RoutePrefetcher:
+    """
+    Keeps the records around the current route position ready in memory
+
+    prefetch() queues the next/previous `depth` positions on the shared pool;
+    get() returns a prefetched record (waiting for it if still in flight) or
+    loads it on the calling thread.
+    """
+
+    def __init__(self, data_loader, depth=PREFETCH_DEPTH):
+        self.data_loader = data_loader
+        self.depth = depth
+        # Window around the current position plus a few recently shown images
+        self.max_entries = 4 * depth + 2
+        self._futures = OrderedDict()
+        # Indices recently handed to the disk cache (bounded; older ones are just warmed again)
+        self._warmed = OrderedDict()
+        self.max_warmed = 4 * DISK_CACHE_WARM_DEPTH
+        self._lock = threading.Lock()
+
+    def _store(self, index, future):
+        """Remember a future as the most recent entry, evicting (and cancelling) the oldest"""
+        self._futures[index] = future
+        self._futures.move_to_end(index)
+        while len(self._futures) > self.max_entries:
+            _, evicted = self._futures.popitem(last=False)
+            evicted.cancel()  # No-op if it already started
+
+    def get(self, index):
+        """Record for a dataset index (see load_image_record)"""
+        with self._lock:
+            future = self._futures.get(index)
+            if future is not None:
+                self._futures.move_to_end(index)
+
+        if future is not None and not future.cancelled():
+            try:
+                return future.result()
+            except Exception:
+                pass  # Load again below so the error surfaces on the page
+
+        record = load_image_record(self.data_loader, index)
+        future = Future()
+        future.set_result(record)
+        with self._lock:
+            self._store(index, future)
+        return record
+
+    def prefetch(self, route_indices, position):
+        """Queue the next and previous `depth` route positions (nearest first, next before previous)"""
+        positions = []
+        for step in range(1, self.depth + 1):
+            positions.extend([position + step, position - step])
+
+        # Resolved here: the workers have no Streamlit script context for cache_resource
+        resources = image_resources()
+        executor = shared_executor()
+        with self._lock:
+            for pos in positions:
+                if not 0 <= pos < len(route_indices):
+                    continue
+                index = route_indices[pos]
+                if index in self._futures and not self._futures[index].cancelled():
+                    self._futures.move_to_end(index)
+                    continue
+                self._store(index, executor.submit(load_image_record, self.data_loader, index, resources))
+
+        self.warm_disk_cache(resources['disk_cache'], route_indices, position)
+
+    def warm_disk_cache(self, disk_cache, route_indices, position):
+        """Copy the originals further ahead on the route to local disk (no decoding)"""
+        if disk_cache is None:
+            return
+
+        ahead = route_indices[position + self.depth + 1:position + DISK_CACHE_WARM_DEPTH + 1]
+        with self._lock:
+            ahead = [index for index in ahead if index not in self._warmed]
+            for index in ahead:
+                self._warmed[index] = True
+            while len(self._warmed) > self.max_warmed:
+                self._warmed.popitem(last=False)
+        merged_df = self.data_loader.merged_df
+        disk_cache.warm(self.data_loader.get_image_path(merged_df.iloc[index]) for index in ahead)
@@ -0,0 +1,97 @@
+"""
+Size-capped store of zoom tile pyramids
+
+Each pyramid directory (preprocessing/tile_pyramid.py) is one entry; its
+mtime records its last use. Once the tiles on disk grow past the cap the
+least recently used pyramids are removed, except those currently open.
+Recently used pyramids are kept open in memory, so a zoom rerun does not
+reopen the original to read its size.
+"""
+
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from pathlib import Path
+import streamlit as st
+from config.config import TILE_CACHE_DIR, TILE_CACHE_GB
+from preprocessing.tile_pyramid import TilePyramid, pyramid_name
+
+# Pyramids kept open (and never evicted while open)
+OPEN_PYRAMIDS = 16
+
+
+class TileCache:
+    """LRU of tile pyramid directories bounded by total size in bytes"""
+
+    def __init__(self, tile_dir, max_bytes, open_pyramids=OPEN_PYRAMIDS):
+        self.tile_dir = Path(tile_dir)
+        self.tile_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.open_pyramids = open_pyramids
+        self._lock = threading.Lock()
+        self._pyramids = OrderedDict()
+        self._accounted = {}
+
+        # Rebuild the LRU order from the directories' mtimes (last use)
+        entries = []
+        for path in self.tile_dir.iterdir():
+            if not path.is_dir():
+                continue
+            size = sum(file.stat().st_size for file in path.rglob('*') if file.is_file())
+            entries.append((path.stat().st_mtime_ns, path.name, size))
+        self._entries = OrderedDict((name, size) for _, name, size in sorted(entries))
+        self.total_bytes = sum(self._entries.values())
+
+    def pyramid(self, cache_key, source_path):
+        """
+        Open pyramid for one version of an original (cache_key: path|size|mtime)
+        source_path: local file to cut missing levels from
+        """
+        name = pyramid_name(cache_key)
+        with self._lock:
+            pyramid = self._pyramids.get(name)
+            if pyramid is not None:
+                self._pyramids.move_to_end(name)
+        if pyramid is None:
+            pyramid = TilePyramid(source_path, self.tile_dir, cache_key)
+            with self._lock:
+                pyramid = self._pyramids.setdefault(name, pyramid)
+                self._pyramids.move_to_end(name)
+                while len(self._pyramids) > self.open_pyramids:
+                    closed, _ = self._pyramids.popitem(last=False)
+                    self._accounted.pop(closed, None)
+        pyramid.source_path = source_path
+        return pyramid
+
+    def record_use(self, pyramid):
+        """Mark a pyramid as recently used, count its new tiles and evict if over the cap"""
+        try:
+            os.utime(pyramid.root)
+        except OSError:
+            pass
+        with self._lock:
+            added = pyramid.bytes_written - self._accounted.get(pyramid.name, 0)
+            self._accounted[pyramid.name] = pyramid.bytes_written
+            self._entries[pyramid.name] = self._entries.get(pyramid.name, 0) + added
+            self._entries.move_to_end(pyramid.name)
+            self.total_bytes += added
+        self._evict()
+
+    def _evict(self):
+        """Remove least recently used pyramids (not open ones) until the tiles fit the cap"""
+        while True:
+            with self._lock:
+                if self.total_bytes <= self.max_bytes:
+                    return
+                name = next((name for name in self._entries if name not in self._pyramids), None)
+                if name is None:
+                    return
+                self.total_bytes -= self._entries.pop(name)
+            shutil.rmtree(self.tile_dir / name, ignore_errors=True)
+
+
+@st.cache_resource(show_spinner=False)
+def get_tile_cache():
+    """Tile pyramid store shared by all sessions of this process"""
+    return TileCache(TILE_CACHE_DIR, int(TILE_CACHE_GB * 1024**3))